@@ -1,6 +1,27 @@
+from django.db import connections
+from django.db.models import F, Value
+from django.db.models.functions import Upper
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
+from recipes.utils import get_tags_mask
+from users.models import Subscriptions
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    '''Сортировка по выбранным полям, при равных значениях - в порядке
+    по умолчанию, чтобы страницы не пересекались.'''
+
+    def __init__(self, *args, tiebreak=(), **kwargs):
+        self.tiebreak = tiebreak
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        return qs.order_by(*ordering, *self.tiebreak)
 
 
 class RecipeFilter(filters.FilterSet):
@@ -9,15 +30,42 @@ class RecipeFilter(filters.FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
+        method='get_tags',
     )
+    search = filters.CharFilter(method='get_search')
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    ordering = StableOrderingFilter(
+        fields=('favorites_count', 'shopping_cart_count', 'pub_date'),
+        tiebreak=('-pub_date', '-id'),
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'search', 'is_favorited', 'is_in_shopping_cart'
+        )
+
+    def get_tags(self, queryset, name, value):
+        '''Рецепты хотя бы с одним из тегов: одно условие по битовой
+        маске вместо соединения с таблицей связей и DISTINCT.'''
+        if not value:
+            return queryset
+        mask = get_tags_mask(tag.id for tag in value)
+        if mask is None:
+            return queryset.filter(tags__in=value).distinct()
+        return queryset.annotate(
+            tags_match=F('tags_mask').bitand(mask)
+        ).filter(tags_match__gt=0)
+
+    def get_search(self, queryset, name, value):
+        '''Полнотекстовый поиск по названию, ингредиентам и тексту;
+        результаты сортируются по релевантности.'''
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value is True:
@@ -30,9 +78,38 @@ class RecipeFilter(filters.FilterSet):
         return queryset
 
 
+class SubscriptionFilter(filters.FilterSet):
+    ordering = StableOrderingFilter(
+        fields=(
+            ('author__recipes_count', 'recipes_count'),
+            ('author__followers_count', 'followers_count'),
+        ),
+        tiebreak=('-id',),
+    )
+
+    class Meta:
+        model = Subscriptions
+        fields = ()
+
+
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='get_name_startswith')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def get_name_startswith(self, queryset, name, value):
+        '''UPPER(name) LIKE UPPER('префикс') || '%' - в таком виде
+        Postgres использует индекс по UPPER(name) с text_pattern_ops:
+        выражение справа вычисляется при планировании. Префикс
+        переводится в верхний регистр той же функцией UPPER, что и
+        название, иначе результаты расходятся на символах вроде «ß».
+        Проверка плана - команда check_ingredient_search. В других базах
+        UPPER() может не работать с кириллицей, там остается
+        istartswith.'''
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(name__istartswith=value)
+        return queryset.annotate(name_upper=Upper('name')).filter(
+            name_upper__startswith=Upper(Value(value))
+        )
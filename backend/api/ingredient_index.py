@@ -0,0 +1,70 @@
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+from recipes.utils import get_table_version
+
+Snapshot = namedtuple('Snapshot', ('version', 'keys', 'items'))
+
+
+class IngredientIndex:
+    '''Индекс ингредиентов в памяти процесса для автодополнения.
+    Хранит отсортированный список названий в нижнем регистре и уже
+    сериализованные ингредиенты. Перестраивается, когда меняется
+    версия таблицы ингредиентов.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _build(self, version):
+        from api.serializers import IngredientSerializer
+
+        if Ingredient.objects.count() > settings.INGREDIENT_INDEX_MAX_SIZE:
+            return Snapshot(version, None, None)
+        items = IngredientSerializer(
+            Ingredient.objects.all(), many=True
+        ).data
+        items = sorted(items, key=lambda item: item['name'].casefold())
+        keys = [item['name'].casefold() for item in items]
+        return Snapshot(version, keys, items)
+
+    def get_snapshot(self):
+        version = get_table_version(Ingredient)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._build(version)
+            return self._snapshot
+
+    def search(self, query):
+        '''Сначала точные совпадения, затем совпадения по началу
+        названия, затем вхождения подстроки. Если справочник больше
+        INGREDIENT_INDEX_MAX_SIZE, индекс не строится и возвращается
+        None - поиск тогда выполняет база данных.'''
+        query = query.casefold()
+        snapshot = self.get_snapshot()
+        keys, items = snapshot.keys, snapshot.items
+        if keys is None:
+            return None
+
+        start = position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            position += 1
+        exact = [items[index] for index in range(start, position)
+                 if keys[index] == query]
+        prefix = [items[index] for index in range(start, position)
+                  if keys[index] != query]
+        substring = [
+            item for key, item in zip(keys, items)
+            if query in key and not key.startswith(query)
+        ]
+        return exact + prefix + substring
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.utils import is_cache_shared
+
+
+class SharedCacheCommand(BaseCommand):
+    '''Команда, которая меняет данные в обход сигналов и сама сбрасывает
+    версии в кэше. С кэшем в памяти процесса запущенный веб-сервер этих
+    сбросов не увидит, поэтому команда завершается с ошибкой, если
+    не указан --local-cache.'''
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--local-cache',
+            action='store_true',
+            help='разрешить кэш в памяти процесса, если веб-сервер '
+                 'не запущен или будет перезапущен',
+        )
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.get('local_cache') and not is_cache_shared():
+            raise CommandError(
+                'Кэш в памяти процесса (CACHE_BACKEND) не общий с '
+                'веб-сервером, и он продолжит отдавать устаревшие данные. '
+                'Настройте общий кэш, например FileBasedCache, или '
+                'перезапустите веб-сервер после команды и укажите '
+                '--local-cache'
+            )
+        return super().execute(*args, **options)
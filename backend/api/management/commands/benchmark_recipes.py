@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер количества SQL-запросов на странице списка рецептов '
+        'при разных значениях limit. Количество запросов не должно '
+        'зависеть от размера страницы. Замер идет без кэша, чтобы '
+        'каждый запрос читал из базы все, что ему нужно. Запуск: '
+        'python manage.py benchmark_recipes --limits 5 100'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limits',
+            nargs='+',
+            type=int,
+            default=[5, 100],
+        )
+        parser.add_argument(
+            '--email',
+            type=str,
+            help='email пользователя, от имени которого идут запросы',
+        )
+
+    def measure(self, client, url):
+        '''Количество запросов без кэша: с кэшем часть данных (id подписок,
+        количество рецептов, представления рецептов) читает из базы только
+        первый запрос, и N+1 при промахе кэша остался бы незамеченным.
+        Кэш подменяется, а не очищается, поэтому общий кэш не теряется.'''
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }}), CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(
+                f'{url} вернул статус {response.status_code}'
+            )
+        return len(context.captured_queries)
+
+    def handle(self, *args, **options):
+        if not Recipe.objects.exists():
+            raise CommandError('В базе нет рецептов для замера')
+
+        clients = {'anonymous': APIClient()}
+        user = User.objects.first()
+        if options['email']:
+            user = User.objects.filter(email=options['email']).first()
+        if user is not None:
+            client = APIClient()
+            client.force_authenticate(user=user)
+            clients[user.email] = client
+
+        recipe_id = Recipe.objects.values_list('id', flat=True).first()
+        unstable = []
+        for name, client in clients.items():
+            counts = {
+                limit: self.measure(client, f'/api/recipes/?limit={limit}')
+                for limit in options['limits']
+            }
+            detail = self.measure(client, f'/api/recipes/{recipe_id}/')
+            for limit, queries in counts.items():
+                print(f'{name}: limit={limit} - {queries} запросов')
+            print(f'{name}: рецепт {recipe_id} - {detail} запросов')
+            if len(set(counts.values())) > 1:
+                unstable.append(name)
+
+        if unstable:
+            raise CommandError(
+                'Количество запросов зависит от размера страницы: '
+                f'{", ".join(unstable)}'
+            )
+        print('Количество запросов не зависит от размера страницы')
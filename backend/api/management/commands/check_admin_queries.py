@@ -0,0 +1,68 @@
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users.models import User
+
+# Предельное количество SQL-запросов на страницу админки, включая сессию
+# и пользователя. Оно не должно расти вместе с таблицами.
+QUERY_BUDGETS = {
+    'changelist': 8,
+    'change': 12,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка количества SQL-запросов на страницах списка и '
+        'редактирования объектов в админке для всех зарегистрированных '
+        'моделей. Изменения откатываются. Запуск: '
+        'python manage.py check_admin_queries'
+    )
+
+    def measure(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'GET {url}: {response.status_code}')
+        return len(context.captured_queries)
+
+    def get_pages(self, model):
+        info = (model._meta.app_label, model._meta.model_name)
+        yield 'changelist', reverse('admin:%s_%s_changelist' % info)
+        obj = model._default_manager.order_by('pk').first()
+        if obj is not None:
+            yield 'change', reverse(
+                'admin:%s_%s_change' % info, args=[obj.pk]
+            )
+
+    def handle(self, *args, **options):
+        results = []
+        with transaction.atomic():
+            user = User.objects.filter(is_superuser=True).first()
+            if user is None:
+                user = User.objects.create_superuser(
+                    'check_admin_queries', 'check@admin.queries', 'password',
+                    first_name='Проверка', last_name='Запросов',
+                )
+            client = Client()
+            client.force_login(user)
+            for model in admin.site._registry:
+                for page, url in self.get_pages(model):
+                    results.append(
+                        (page, url, self.measure(client, url))
+                    )
+            transaction.set_rollback(True)
+
+        failed = False
+        for page, url, count in results:
+            budget = QUERY_BUDGETS[page]
+            print(f'{url}: {count} (бюджет {budget})')
+            if count > budget:
+                failed = True
+        if failed:
+            raise CommandError('Превышен бюджет SQL-запросов')
+        print('Количество запросов в пределах бюджета')
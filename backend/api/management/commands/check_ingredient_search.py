@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.filters import IngredientFilter
+from recipes.models import Ingredient
+
+INDEX_NAME = 'recipes_ingredient_name_upper_like'
+SEQ_SCAN = f'Seq Scan on {Ingredient._meta.db_table}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка, что поиск ингредиентов по началу названия использует '
+        f'индекс {INDEX_NAME}, а не последовательное чтение таблицы '
+        '(только Postgres). В таблицу временно добавляются синтетические '
+        'ингредиенты, после ANALYZE выводится план запроса фильтра, '
+        'изменения откатываются. Запуск: '
+        'python manage.py check_ingredient_search --rows 200000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            default=200000,
+            type=int,
+            help='количество синтетических ингредиентов',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='сол',
+            type=str,
+            help='начало названия для поиска',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                f'Индекс {INDEX_NAME} создается только в Postgres, '
+                f'текущая база: {connection.vendor}'
+            )
+        table = Ingredient._meta.db_table
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} (name, measurement_unit) '
+                    "SELECT 'синтетика ' || md5(i::text), 'г' "
+                    'FROM generate_series(1, %s) AS i',
+                    [options['rows']]
+                )
+                cursor.execute(f'ANALYZE {table}')
+            queryset = IngredientFilter(
+                {'name': options['prefix']},
+                queryset=Ingredient.objects.all(),
+            ).qs
+            plan = queryset.explain()
+            found = queryset.count()
+            transaction.set_rollback(True)
+
+        print(plan)
+        print(f'Найдено ингредиентов: {found}')
+        if SEQ_SCAN in plan:
+            raise CommandError(f'В плане запроса есть {SEQ_SCAN}')
+        if INDEX_NAME not in plan:
+            raise CommandError(f'Запрос не использует индекс {INDEX_NAME}')
+        print(f'Запрос использует индекс {INDEX_NAME}')
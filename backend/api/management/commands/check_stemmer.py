@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.stemmer import stem, stem_words
+
+# Слова и их основы из эталонного словаря Snowball для русского языка
+# (snowball-data, russian/voc.txt и output.txt), а также слова из рецептов
+# с основами по тем же правилам.
+SNOWBALL_SAMPLES = {
+    'в': 'в',
+    'вагона': 'вагон',
+    'вагоне': 'вагон',
+    'вагонов': 'вагон',
+    'вагоном': 'вагон',
+    'вагоны': 'вагон',
+    'важная': 'важн',
+    'важнее': 'важн',
+    'важнейшие': 'важн',
+    'важнейшими': 'важн',
+    'важничал': 'важнича',
+    'важного': 'важн',
+    'важности': 'важност',
+    'важностью': 'важност',
+    'важность': 'важност',
+    'вазах': 'ваз',
+    'вакханка': 'вакханк',
+    'валандался': 'валанда',
+    'валериановых': 'валерианов',
+    'валерию': 'валер',
+    'валетами': 'валет',
+    'валился': 'вал',
+    'валится': 'вал',
+    'вальсишку': 'вальсишк',
+    'валяется': 'валя',
+    'валялась': 'валя',
+    'валять': 'валя',
+    'валяются': 'валя',
+    'длинный': 'длин',
+    'картофель': 'картофел',
+    'картофелем': 'картофел',
+    'помидоры': 'помидор',
+    'сметаной': 'сметан',
+    'яйца': 'яйц',
+    'молоко': 'молок',
+    'жареная': 'жарен',
+    'борща': 'борщ',
+}
+# Разбор текста: регистр, «ё» и слова без русских гласных.
+TEXT_SAMPLES = {
+    'Свёкла, КАРТОФЕЛЬ и 2 яйца!': ['свекл', 'картофел', 'и', '2', 'яйц'],
+    'Pasta al dente': ['pasta', 'al', 'dente'],
+    '': [],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка стеммера поиска по рецептам на словах с известными '
+        'основами из эталонного словаря Snowball. Запуск: '
+        'python manage.py check_stemmer'
+    )
+
+    def handle(self, *args, **options):
+        failed = [
+            f'{word}: {stem(word)} вместо {expected}'
+            for word, expected in SNOWBALL_SAMPLES.items()
+            if stem(word) != expected
+        ] + [
+            f'{text!r}: {stem_words(text)} вместо {expected}'
+            for text, expected in TEXT_SAMPLES.items()
+            if stem_words(text) != expected
+        ]
+        for line in failed:
+            print(line)
+        if failed:
+            raise CommandError('Стеммер расходится с эталоном Snowball')
+        print(
+            f'Проверено слов: {len(SNOWBALL_SAMPLES)}, '
+            f'текстов: {len(TEXT_SAMPLES)}, расхождений нет'
+        )
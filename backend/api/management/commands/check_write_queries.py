@@ -0,0 +1,140 @@
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Tag
+from users.models import User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAQMAAAAl21bKAAAA'
+    'A1BMVEUAAACnej3aAAAAAXRSTlMAQObYZgAAAApJREFUCNdjYAAAAAIAAeIhvDMAAAAASU'
+    'VORK5CYII='
+)
+# Предельное количество SQL-запросов на операцию, включая аутентификацию,
+# чтение рецепта для ответа и действия после фиксации транзакции:
+# переиндексацию поиска и создание копий изображения. Удаление включает
+# DELETE из таблицы рейтинга популярных рецептов (каскад по OneToOne).
+QUERY_BUDGETS = {
+    'create': 20,
+    'update_ingredients': 31,
+    'update_name': 13,
+    'delete': 15,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка количества SQL-запросов при создании, изменении и '
+        'удалении рецепта: оно не должно зависеть от числа ингредиентов '
+        'и превышать бюджет. Изменения откатываются, изображения '
+        'сохраняются во временный каталог. Запуск: '
+        'python manage.py check_write_queries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            default=[3, 30],
+            type=int,
+            help='количество ингредиентов в рецепте',
+        )
+
+    def run_on_commit(self):
+        '''Выполняет действия, отложенные до фиксации транзакции: проверка
+        откатывается, и без этого их запросы не попали бы в замер.'''
+        while connection.run_on_commit:
+            callbacks = connection.run_on_commit
+            connection.run_on_commit = []
+            for _, callback in callbacks:
+                callback()
+
+    def measure(self, client, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, format='json')
+            self.run_on_commit()
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {url}: {response.data}')
+        return response, len(context.captured_queries)
+
+    def run_operations(self, client, ingredient_ids, tag_ids, size):
+        ingredients = ingredient_ids[:size]
+        data = {
+            'name': 'Проверка запросов',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': tag_ids[:2],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 10}
+                for ingredient_id in ingredients
+            ],
+        }
+        response, queries = self.measure(client, 'post', '/api/recipes/', data)
+        counts = {'create': queries}
+        url = f'/api/recipes/{response.data["id"]}/'
+
+        quarter = max(1, size // 4)
+        kept = ingredients[quarter:]
+        added = ingredient_ids[size:size + quarter]
+        data['tags'] = tag_ids[1:3]
+        data['ingredients'] = [
+            {'id': ingredient_id, 'amount': 10 + index % 2}
+            for index, ingredient_id in enumerate(kept + added)
+        ]
+        del data['image']
+        counts['update_ingredients'] = self.measure(
+            client, 'patch', url, data
+        )[1]
+        counts['update_name'] = self.measure(
+            client, 'patch', url, {'name': 'Новое название'}
+        )[1]
+        counts['delete'] = self.measure(client, 'delete', url)[1]
+        return counts
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[
+                :max(sizes) + max(sizes) // 4 + 1
+            ]
+        )
+        tag_ids = list(Tag.objects.values_list('id', flat=True)[:3])
+        user = User.objects.order_by('id').first()
+        if len(ingredient_ids) <= max(sizes) or len(tag_ids) < 3 or not user:
+            raise CommandError(
+                'Недостаточно данных: нужны пользователь, три тега и '
+                f'не меньше {max(sizes) + 1} ингредиентов'
+            )
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        results = {}
+        # Копии изображения создаются сразу, а не в пуле потоков: там
+        # другое соединение, которое не видит незафиксированный рецепт.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, IMAGE_PIPELINE_WORKERS=0
+        ), transaction.atomic():
+            for size in sizes:
+                results[size] = self.run_operations(
+                    client, ingredient_ids, tag_ids, size
+                )
+            transaction.set_rollback(True)
+
+        failed = False
+        for operation, budget in QUERY_BUDGETS.items():
+            counts = {size: results[size][operation] for size in sizes}
+            print(
+                f'{operation}: '
+                + ', '.join(f'{size} ингр. - {count}'
+                            for size, count in counts.items())
+                + f' (бюджет {budget})'
+            )
+            if len(set(counts.values())) > 1 or max(counts.values()) > budget:
+                failed = True
+        if failed:
+            raise CommandError('Превышен бюджет SQL-запросов')
+        print('Количество запросов в пределах бюджета')
@@ -0,0 +1,98 @@
+import posixpath
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+IMAGE_FIELD = Recipe._meta.get_field('image')
+
+
+def get_references():
+    '''Количество рецептов, ссылающихся на каждый файл изображения, и
+    версии копий, на которые ведут их ссылки.'''
+    counts = Counter()
+    versions = defaultdict(set)
+    for name, version in Recipe.objects.exclude(image='').values_list(
+        'image', 'variants_version'
+    ).iterator():
+        counts[name] += 1
+        versions[get_original_key(name)[0]].add(version)
+    return counts, versions
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+def get_original_key(name):
+    '''Ключ оригинала, к которому относится файл, и версия копии: для
+    media/ab/variants/abc_card_1a2b3c4d.webp это ((media/ab, abc),
+    1a2b3c4d), для самого оригинала версия None. Копии без версии в
+    имени получают версию '', на нее не ссылается ни один рецепт.'''
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    if posixpath.basename(directory) == 'variants':
+        parts = stem.rsplit('_', 2)
+        version = parts[2] if len(parts) == 3 else ''
+        return (posixpath.dirname(directory), parts[0]), version
+    return (directory, stem), None
+
+
+def is_referenced(name, versions):
+    key, version = get_original_key(name)
+    if key not in versions:
+        return False
+    return version is None or version in versions[key]
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление файлов изображений, на которые не ссылается ни один '
+        'рецепт, вместе с их уменьшенными копиями, а также копий '
+        'устаревших версий. Запуск: '
+        'python manage.py collect_media_garbage --min-age 24'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            default=24,
+            type=int,
+            help='не трогать файлы моложе указанного количества часов',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только показать, что будет удалено',
+        )
+
+    def handle(self, *args, **options):
+        storage = IMAGE_FIELD.storage
+        references, versions = get_references()
+        deadline = timezone.now() - timedelta(hours=options['min_age'])
+        removed = kept = 0
+        for name in walk(storage, IMAGE_FIELD.upload_to.rstrip('/')):
+            if (
+                is_referenced(name, versions)
+                or storage.get_modified_time(name) > deadline
+            ):
+                kept += 1
+                continue
+            if options['dry_run']:
+                print(name)
+            else:
+                storage.delete(name)
+            removed += 1
+        shared = sum(1 for count in references.values() if count > 1)
+        label = 'К удалению' if options['dry_run'] else 'Удалено'
+        print(
+            f'{label} файлов: {removed}, оставлено: {kept}, '
+            f'изображений у нескольких рецептов: {shared}'
+        )
@@ -0,0 +1,109 @@
+import base64
+import json
+import mimetypes
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import IngredientsForRecipe, Recipe
+
+
+def encode_image(image):
+    '''Возвращает изображение в виде data URI, как его принимает API.'''
+    if not image:
+        return None
+    try:
+        with image.open('rb') as file:
+            content = file.read()
+    except (FileNotFoundError, OSError):
+        return None
+    content_type = mimetypes.guess_type(image.name)[0] or 'image/jpeg'
+    data = base64.b64encode(content).decode()
+    return f'data:{content_type};base64,{data}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка рецептов в формате JSON Lines (один рецепт на строку). '
+        'Запуск: python manage.py export_recipes recipes.jsonl'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            nargs='?',
+            default='-',
+            type=str,
+            help='файл для выгрузки, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=500,
+            type=int,
+        )
+        parser.add_argument(
+            '--no-images',
+            action='store_true',
+            help='не выгружать изображения',
+        )
+
+    def get_batches(self, batch_size):
+        '''Рецепты читаются пачками по возрастанию id, для каждой пачки
+        теги и ингредиенты подгружаются отдельными запросами.'''
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_used',
+                queryset=IngredientsForRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        ).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
+
+    def serialize(self, recipe, with_images):
+        return {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'author': recipe.author.email,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.ingredients_used.all()
+            ],
+            'image': encode_image(recipe.image) if with_images else None,
+        }
+
+    def handle(self, *args, **options):
+        output = options['output']
+        file = (
+            sys.stdout if output == '-'
+            else open(output, 'w', encoding='utf8')
+        )
+        exported = 0
+        try:
+            for batch in self.get_batches(options['batch_size']):
+                for recipe in batch:
+                    line = json.dumps(
+                        self.serialize(recipe, not options['no_images']),
+                        ensure_ascii=False,
+                    )
+                    file.write(line + '\n')
+                exported += len(batch)
+                self.stderr.write(f'Выгружено рецептов: {exported}')
+        finally:
+            if file is not sys.stdout:
+                file.close()
@@ -0,0 +1,207 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from api.management.base import SharedCacheCommand
+from recipes.models import (FavouriteRecipes, Ingredient, IngredientsForRecipe,
+                            Recipe, ShopList, Tag)
+from recipes.search import update_search_index
+from recipes.utils import bump_table_version, update_tags_masks
+from users.models import Subscriptions, User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def skewed_weights(size, skew):
+    '''Веса по закону Ципфа: первый элемент популярнее остальных,
+    skew=0 дает равномерное распределение.'''
+    return [1 / (rank + 1) ** skew for rank in range(size)]
+
+
+class Command(SharedCacheCommand):
+    help = (
+        'Генерация тестовых данных для нагрузочных замеров: пользователи, '
+        'рецепты, ингредиенты в рецептах, избранное, списки покупок '
+        'и подписки. Пример: '
+        'python manage.py generate_data --users 1000 --recipes 20000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=1000, type=int)
+        parser.add_argument('--recipes', default=10000, type=int)
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            default=8,
+            type=int,
+            help='среднее количество ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--favorites',
+            default=20,
+            type=int,
+            help='среднее количество избранных рецептов у пользователя',
+        )
+        parser.add_argument(
+            '--cart',
+            default=5,
+            type=int,
+            help='среднее количество рецептов в списке покупок',
+        )
+        parser.add_argument(
+            '--subscriptions',
+            default=10,
+            type=int,
+            help='среднее количество подписок у пользователя',
+        )
+        parser.add_argument(
+            '--skew',
+            default=1.0,
+            type=float,
+            help='неравномерность популярности авторов и рецептов',
+        )
+        parser.add_argument('--seed', default=None, type=int)
+        parser.add_argument(
+            '--batch-size',
+            default=None,
+            type=int,
+            help='размер пачки вставки, по умолчанию выбирает Django',
+        )
+
+    def sample(self, population, weights, average):
+        '''Выборка без повторов, размер колеблется вокруг average.'''
+        size = min(len(population), max(0, int(random.gauss(
+            average, average / 3
+        ))))
+        return set(random.choices(population, weights, k=size))
+
+    def create_users(self, count, prefix):
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    email=f'{prefix}{index}@example.com',
+                    username=f'{prefix}{index}',
+                    first_name='Имя',
+                    last_name='Фамилия',
+                    password=password,
+                )
+                for index in range(count)
+            ],
+            batch_size=self.batch_size,
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, count, user_ids, skew):
+        authors = random.choices(
+            user_ids, skewed_weights(len(user_ids), skew), k=count
+        )
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    name=f'Рецепт {index}',
+                    text='Описание рецепта. ' * random.randint(5, 50),
+                    cooking_time=random.randint(5, 180),
+                    author_id=author_id,
+                    image='media/benchmark.png',
+                )
+                for index, author_id in enumerate(authors)
+            ],
+            batch_size=self.batch_size,
+        )
+        return list(Recipe.objects.filter(
+            author_id__in=user_ids
+        ).values_list('id', flat=True))
+
+    def bulk_insert(self, model, objects, label=None):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        label = label or model._meta.verbose_name_plural
+        print(f'{label}: {len(objects)}')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        skew = options['skew']
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Справочник ингредиентов пуст, сначала выполните '
+                'python manage.py import_ingredients'
+            )
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                [Tag(name=name, color=color, slug=slug)
+                 for name, color, slug in DEFAULT_TAGS]
+            )
+            bump_table_version(Tag)
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        prefix = f'bench{random.randint(0, 10 ** 6)}_'
+
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'], prefix)
+            print(f'Пользователи: {len(user_ids)}')
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, skew
+            )
+            print(f'Рецепты: {len(recipe_ids)}')
+
+            ingredient_weights = skewed_weights(len(ingredient_ids), skew)
+            self.bulk_insert(IngredientsForRecipe, [
+                IngredientsForRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=random.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in self.sample(
+                    ingredient_ids, ingredient_weights,
+                    options['ingredients_per_recipe']
+                ) or {random.choice(ingredient_ids)}
+            ])
+            self.bulk_insert(Recipe.tags.through, [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in random.sample(
+                    tag_ids, random.randint(1, len(tag_ids))
+                )
+            ], label='Теги рецептов')
+            update_tags_masks(recipe_ids)
+            update_search_index(recipe_ids)
+
+            recipe_weights = skewed_weights(len(recipe_ids), skew)
+            self.bulk_insert(FavouriteRecipes, [
+                FavouriteRecipes(fan_user_id=user_id, fav_recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in self.sample(
+                    recipe_ids, recipe_weights, options['favorites']
+                )
+            ])
+            self.bulk_insert(ShopList, [
+                ShopList(shopper_id=user_id, recipe_to_shop_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in self.sample(
+                    recipe_ids, recipe_weights, options['cart']
+                )
+            ])
+            author_weights = skewed_weights(len(user_ids), skew)
+            self.bulk_insert(Subscriptions, [
+                Subscriptions(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in self.sample(
+                    user_ids, author_weights, options['subscriptions']
+                )
+                if author_id != user_id
+            ])
+            call_command('shoplist_totals')
+            call_command('repair_counters')
+        print(f'Данные созданы, логины пользователей: {prefix}N@example.com')
@@ -0,0 +1,70 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes.images import VARIANTS_VERSION, render_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание уменьшенных копий изображений для рецептов, у которых '
+        'их еще нет или они созданы с другими параметрами. Новые копии '
+        'сохраняются под новыми именами, старые остаются до запуска '
+        'collect_media_garbage. Запуск: '
+        'python manage.py generate_image_variants --workers 4'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            default=4,
+            type=int,
+            help='количество процессов для обработки изображений',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=100,
+            type=int,
+        )
+
+    def get_batches(self, queryset, batch_size):
+        last_id = 0
+        while True:
+            batch = list(
+                queryset.filter(id__gt=last_id).values_list('id', 'image')
+                [:batch_size]
+            )
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1][0]
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.exclude(image='').exclude(
+            variants_version=VARIANTS_VERSION
+        ).order_by('id')
+        processed = failed = 0
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=django.setup,
+        )
+        try:
+            for batch in self.get_batches(queryset, options['batch_size']):
+                results = pool.map(
+                    render_variants, [name for _, name in batch]
+                )
+                for (recipe_id, name), result in zip(batch, results):
+                    if not result:
+                        failed += 1
+                        continue
+                    Recipe.objects.filter(id=recipe_id, image=name).update(
+                        variants_version=VARIANTS_VERSION
+                    )
+                    processed += 1
+                print(f'Обработано: {processed}, ошибок: {failed}')
+        finally:
+            pool.shutdown()
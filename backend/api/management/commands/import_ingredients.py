@@ -1,16 +1,22 @@
 import csv
+import io
 import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
+from django.db import connection, transaction
 
-from api.serializers import IngredientSerializer
+from api.management.base import SharedCacheCommand
 from recipes.models import Ingredient
+from recipes.utils import bump_table_version
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data/')
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
 
 
-class Command(BaseCommand):
+class Command(SharedCacheCommand):
     help = (
         'Загрузка ингредиентов в базу данных из csv-файла '
         f'поместите файл в папку {DATA_ROOT} и запустите команду:'
@@ -24,31 +30,108 @@ class Command(BaseCommand):
             nargs='?',
             type=str
         )
+        parser.add_argument(
+            '--batch-size',
+            default=5000,
+            type=int,
+            help='количество строк, загружаемых в одной транзакции',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только проверить файл, ничего не записывая в базу',
+        )
+
+    def validate(self, rows, errors_in_data):
+        '''Проверяет строки в памяти, без запросов к базе,
+        и отбрасывает повторы внутри файла.'''
+        seen = set()
+        for row in rows:
+            if len(row) < 2:
+                errors_in_data.append(', '.join(row))
+                continue
+            name, measurement_unit = row[0].strip(), row[1].strip()
+            if (not name or not measurement_unit
+                    or len(name) > NAME_MAX_LENGTH
+                    or len(measurement_unit) > UNIT_MAX_LENGTH):
+                errors_in_data.append(', '.join(row))
+                continue
+            if (name, measurement_unit) in seen:
+                continue
+            seen.add((name, measurement_unit))
+            yield name, measurement_unit
+
+    def insert_batch(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    def copy_batch(self, batch):
+        '''Быстрый путь для Postgres: COPY во временную таблицу
+        и вставка оттуда с пропуском уже существующих ингредиентов.'''
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar, measurement_unit varchar) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT DO NOTHING'
+            )
 
     def handle(self, *args, **options):
         input_file = options['filename']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        save_batch = (
+            self.copy_batch if connection.vendor == 'postgresql'
+            else self.insert_batch
+        )
         errors_in_data = []
-        with open(
-            os.path.join(DATA_ROOT, input_file),
-            newline='',
-            encoding='utf8'
-        ) as csv_file:
-            try:
-                file_content = csv.reader(csv_file)
-                for row in file_content:
-                    data = {
-                        'name': row[0],
-                        'measurement_unit': row[1],
-                    }
-                    serializer = IngredientSerializer(data=data)
-                    if serializer.is_valid():
-                        Ingredient.objects.get_or_create(**data)
-                    else:
-                        errors_in_data.append(', '.join(row))
-            except FileNotFoundError:
-                raise CommandError(
-                    f'Файл {input_file} не найден в папке {DATA_ROOT}'
-                )
+        processed = 0
+        initial_count = Ingredient.objects.count()
+        try:
+            with open(
+                os.path.join(DATA_ROOT, input_file),
+                newline='',
+                encoding='utf8'
+            ) as csv_file:
+                rows = self.validate(csv.reader(csv_file), errors_in_data)
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    if not options['dry_run']:
+                        with transaction.atomic():
+                            save_batch(batch)
+                    processed += len(batch)
+                    print(f'Обработано строк: {processed}')
+        except FileNotFoundError:
+            raise CommandError(
+                f'Файл {input_file} не найден в папке {DATA_ROOT}'
+            )
+
+        if options['dry_run']:
+            print(f'Проверка завершена, корректных строк: {processed}')
+        else:
+            bump_table_version(Ingredient)
+            created = Ingredient.objects.count() - initial_count
+            print(f'Добавлено новых ингредиентов: {created}')
 
         if errors_in_data:
             output_file = os.path.join(DATA_ROOT, 'errors_ingredients.txt')
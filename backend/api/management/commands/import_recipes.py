@@ -0,0 +1,267 @@
+import base64
+import binascii
+import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import django
+from django.core.files.base import ContentFile
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from api.management.base import SharedCacheCommand
+from recipes.images import VARIANTS_VERSION, render_variants
+from recipes.models import Ingredient, IngredientsForRecipe, Recipe, Tag
+from recipes.search import update_search_index
+from recipes.utils import (bump_table_version, bump_versions, repair_counters,
+                           update_tags_masks)
+from users.models import User
+
+IMAGE_FIELD = Recipe._meta.get_field('image')
+NAME_MAX_LENGTH = Recipe._meta.get_field('name').max_length
+INGREDIENT_NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field(
+    'measurement_unit'
+).max_length
+
+
+def store_image(data_uri):
+    '''Декодирует изображение из data URI, сохраняет его в хранилище
+    и создает уменьшенные копии. Выполняется в отдельном процессе,
+    к базе данных не обращается. Возвращает имя файла и версию
+    копий ('' - копии не созданы), None - если изображение не
+    декодируется.'''
+    if not data_uri:
+        return '', ''
+    try:
+        header, data = data_uri.split(';base64,', 1)
+        content = base64.b64decode(data)
+    except (ValueError, binascii.Error):
+        return None
+    extension = header.rsplit('/', 1)[-1] or 'jpg'
+    name = f'{IMAGE_FIELD.upload_to}{uuid.uuid4()}.{extension}'
+    name = IMAGE_FIELD.storage.save(name, ContentFile(content))
+    return name, VARIANTS_VERSION if render_variants(name) else ''
+
+
+def is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and (
+        value >= 1
+    )
+
+
+def is_text(value, max_length=None):
+    return isinstance(value, str) and bool(value.strip()) and (
+        max_length is None or len(value) <= max_length
+    )
+
+
+def parse_pub_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Command(SharedCacheCommand):
+    help = (
+        'Загрузка рецептов из файла JSON Lines, выгруженного командой '
+        'export_recipes. Запуск: '
+        'python manage.py import_recipes recipes.jsonl --workers 4'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', type=str)
+        parser.add_argument(
+            '--batch-size',
+            default=500,
+            type=int,
+        )
+        parser.add_argument(
+            '--workers',
+            default=4,
+            type=int,
+            help='количество процессов для обработки изображений',
+        )
+
+    def validate_ingredient(self, item):
+        return (
+            isinstance(item, dict)
+            and is_text(item.get('name'), INGREDIENT_NAME_MAX_LENGTH)
+            and is_text(item.get('measurement_unit'), UNIT_MAX_LENGTH)
+            and is_positive_int(item.get('amount'))
+        )
+
+    def validate(self, data):
+        '''Проверяет типы всех полей строки: неверная строка
+        пропускается, а не прерывает загрузку посередине.'''
+        if not isinstance(data, dict):
+            return False
+        ingredients = data.get('ingredients')
+        tags = data.get('tags', [])
+        return (
+            is_text(data.get('name'), NAME_MAX_LENGTH)
+            and is_text(data.get('text'))
+            and is_text(data.get('author'))
+            and is_positive_int(data.get('cooking_time'))
+            and isinstance(ingredients, list)
+            and bool(ingredients)
+            and all(self.validate_ingredient(item) for item in ingredients)
+            and isinstance(tags, list)
+            and all(isinstance(slug, str) for slug in tags)
+            and isinstance(data.get('image') or '', str)
+            and (not data.get('pub_date')
+                 or parse_pub_date(data['pub_date']) is not None)
+        )
+
+    def get_ingredients(self, batch):
+        '''Ищет ингредиенты пачки одним запросом, недостающие создает.'''
+        keys = {
+            (item['name'], item['measurement_unit'])
+            for data in batch for item in data['ingredients']
+        }
+        names = {name for name, _ in keys}
+        ingredients = {
+            (item.name, item.measurement_unit): item.id
+            for item in Ingredient.objects.filter(name__in=names)
+        }
+        missing = keys - set(ingredients)
+        if missing:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in missing
+                ],
+                ignore_conflicts=True,
+            )
+            bump_table_version(Ingredient)
+            ingredients.update(
+                ((item.name, item.measurement_unit), item.id)
+                for item in Ingredient.objects.filter(
+                    name__in={name for name, _ in missing}
+                )
+            )
+        return ingredients
+
+    def create_recipes(self, recipes):
+        '''Вставка без сигналов post_save: их работу (маски тегов,
+        поисковый индекс, счетчики, версии лент) import_batch выполняет
+        сам, один раз на пачку. Postgres возвращает id из INSERT,
+        в SQLite id выдаются по порядку, а транзакция не дает другим
+        процессам писать в это время, поэтому новые id - все id после
+        прежнего максимума.'''
+        if connection.features.can_return_ids_from_bulk_insert:
+            return Recipe.objects.bulk_create(recipes)
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'Загрузка рецептов поддерживается в Postgres и SQLite'
+            )
+        last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id']
+        Recipe.objects.bulk_create(recipes)
+        ids = Recipe.objects.filter(id__gt=last_id or 0).order_by(
+            'id'
+        ).values_list('id', flat=True)
+        for recipe, recipe_id in zip(recipes, ids):
+            recipe.id = recipe_id
+        return recipes
+
+    def import_batch(self, batch, images, tags):
+        authors = dict(
+            User.objects.filter(
+                email__in={data['author'] for data in batch}
+            ).values_list('email', 'id')
+        )
+        ingredients = self.get_ingredients(batch)
+        rows = [
+            (data, image) for data, image in zip(batch, images)
+            if data['author'] in authors and image is not None
+        ]
+        recipes = self.create_recipes([
+            Recipe(
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                author_id=authors[data['author']],
+                image=image[0],
+                variants_version=image[1],
+            )
+            for data, image in rows
+        ])
+        dated = []
+        for recipe, (data, _) in zip(recipes, rows):
+            if data.get('pub_date'):
+                recipe.pub_date = parse_pub_date(data['pub_date'])
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tags[slug])
+                for recipe, (data, _) in zip(recipes, rows)
+                for slug in set(data.get('tags', [])) if slug in tags
+            ]
+        )
+        update_tags_masks([recipe.id for recipe in recipes])
+        IngredientsForRecipe.objects.bulk_create(
+            [
+                IngredientsForRecipe(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredients[
+                        (item['name'], item['measurement_unit'])
+                    ],
+                    amount=item['amount'],
+                )
+                for recipe, (data, _) in zip(recipes, rows)
+                for item in data['ingredients']
+            ],
+            ignore_conflicts=True,
+        )
+        update_search_index([recipe.id for recipe in recipes])
+        author_ids = {recipe.author_id for recipe in recipes}
+        repair_counters(['recipes_count'], ids=author_ids)
+        bump_versions('author_version', author_ids)
+        return len(recipes)
+
+    def parse_line(self, line):
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+    def read_batches(self, file, batch_size):
+        lines = (line for line in file if line.strip())
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                return
+            yield [self.parse_line(line) for line in batch]
+
+    def handle(self, *args, **options):
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        imported = skipped = 0
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=django.setup,
+        )
+        try:
+            with open(options['input'], encoding='utf8') as file:
+                for batch in self.read_batches(file, options['batch_size']):
+                    valid = [data for data in batch if self.validate(data)]
+                    images = list(pool.map(
+                        store_image, [data.get('image') for data in valid]
+                    ))
+                    with transaction.atomic():
+                        created = self.import_batch(valid, images, tags)
+                    imported += created
+                    skipped += len(batch) - created
+                    print(
+                        f'Загружено рецептов: {imported}, '
+                        f'пропущено: {skipped}'
+                    )
+        except FileNotFoundError:
+            raise CommandError(f'Файл {options["input"]} не найден')
+        finally:
+            pool.shutdown()
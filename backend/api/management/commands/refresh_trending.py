@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет рейтинга популярных рецептов для /api/recipes/trending/ '
+        'по добавлениям в избранное и списки покупок за последние дни. '
+        'Рассчитана на запуск по расписанию: '
+        'python manage.py refresh_trending'
+    )
+
+    def handle(self, *args, **options):
+        added, updated, removed = refresh_trending()
+        print(
+            f'Рейтинг обновлен: добавлено {added}, обновлено {updated}, '
+            f'удалено {removed}'
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.utils import COUNTERS, repair_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка счетчиков избранного и списков покупок у рецептов, '
+        'рецептов и подписчиков у пользователей с таблицами связей '
+        'и исправление расхождений. Рассчитана на периодический запуск. '
+        'Только проверка без исправления: '
+        'python manage.py repair_counters --verify'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='только вывести расхождения, не исправляя их',
+        )
+        parser.add_argument(
+            '--counters',
+            nargs='+',
+            choices=list(COUNTERS),
+            help='проверить только указанные счетчики',
+        )
+
+    def handle(self, *args, **options):
+        repaired = repair_counters(
+            options['counters'], dry_run=options['verify']
+        )
+        for field, count in repaired.items():
+            print(f'{field}: расхождений {count}')
+        if options['verify'] or not any(repaired.values()):
+            return
+        print('Расхождения исправлены')
@@ -0,0 +1,176 @@
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+
+def percentile(values, percent):
+    '''Перцентиль по методу ближайшего ранга.'''
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер основных эндпойнтов через тестовый клиент '
+        'Django. Отчет в JSON: задержки p50/p95/p99, пропускная '
+        'способность и количество SQL-запросов на запрос. Пример: '
+        'python manage.py run_benchmark --requests 200 --output report.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            default=100,
+            type=int,
+            help='количество запросов к каждому эндпойнту',
+        )
+        parser.add_argument('--limit', default=6, type=int)
+        parser.add_argument('--seed', default=None, type=int)
+        parser.add_argument(
+            '--output',
+            default='-',
+            type=str,
+            help='файл для отчета, по умолчанию stdout',
+        )
+
+    def get_user(self):
+        '''Пользователь с подписками и списком покупок.'''
+        user = User.objects.annotate(
+            subscriptions=Count('followed_authors', distinct=True),
+            cart=Count('recipes_to_shop', distinct=True),
+        ).filter(subscriptions__gt=0, cart__gt=0).order_by('id').first()
+        return user or User.objects.order_by('id').first()
+
+    def get_scenarios(self, limit):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        prefixes = [
+            name[:3] for name in
+            Ingredient.objects.values_list('name', flat=True)[:500]
+        ]
+        if not recipe_ids or not prefixes:
+            raise CommandError(
+                'Нет данных для замера, выполните '
+                'python manage.py generate_data'
+            )
+
+        def detail():
+            return 'get', f'/api/recipes/{random.choice(recipe_ids)}/'
+
+        def write(action, method):
+            def scenario():
+                recipe_id = self.write_targets[action]
+                return method, f'/api/recipes/{recipe_id}/{action}/'
+            return scenario
+
+        return {
+            'recipes_list': lambda: (
+                'get', f'/api/recipes/?limit={limit}'
+                f'&page={random.randint(1, 20)}'
+            ),
+            'recipes_detail': detail,
+            'subscriptions': lambda: (
+                'get', f'/api/users/subscriptions/?limit={limit}'
+                '&recipes_limit=3'
+            ),
+            'ingredients_search': lambda: (
+                'get', f'/api/ingredients/?name={random.choice(prefixes)}'
+            ),
+            'download_shopping_cart': lambda: (
+                'get', '/api/recipes/download_shopping_cart/'
+            ),
+            'favorite_add': write('favorite', 'post'),
+            'favorite_remove': write('favorite', 'delete'),
+            'shopping_cart_add': write('shopping_cart', 'post'),
+            'shopping_cart_remove': write('shopping_cart', 'delete'),
+        }
+
+    def pick_write_targets(self, user):
+        '''Рецепт, которого нет ни в избранном, ни в корзине: запись
+        добавляется и удаляется, данные после замера не меняются.'''
+        recipe = Recipe.objects.exclude(
+            fan_user__fan_user=user
+        ).exclude(shoppers__shopper=user).order_by('?').first()
+        self.write_targets = {
+            'favorite': recipe.id,
+            'shopping_cart': recipe.id,
+        }
+
+    def request(self, client, method, url):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = getattr(client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(context.captured_queries)
+
+    def run(self, client, scenarios, requests):
+        results = {name: [] for name in scenarios}
+        for _ in range(requests):
+            for name, scenario in scenarios.items():
+                if name == 'favorite_add':
+                    self.pick_write_targets(self.user)
+                method, url = scenario()
+                results[name].append(self.request(client, method, url))
+        return results
+
+    def summarize(self, measurements):
+        timings = [elapsed for _, elapsed, _ in measurements]
+        total = sum(timings)
+        return {
+            'requests': len(measurements),
+            'errors': sum(1 for status, _, _ in measurements
+                          if status >= 400),
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 99) * 1000, 2),
+            'mean_ms': round(total / len(timings) * 1000, 2),
+            'throughput_rps': round(len(timings) / total, 1) if total else 0,
+            'queries_per_request': round(
+                sum(queries for _, _, queries in measurements)
+                / len(measurements), 2
+            ),
+        }
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть больше нуля')
+        self.user = self.get_user()
+        if self.user is None:
+            raise CommandError(
+                'Нет пользователей, выполните python manage.py generate_data'
+            )
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        scenarios = self.get_scenarios(options['limit'])
+        results = self.run(client, scenarios, options['requests'])
+
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'recipes': Recipe.objects.count(),
+            'users': User.objects.count(),
+            'endpoints': {
+                name: self.summarize(measurements)
+                for name, measurements in results.items()
+            },
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output'] == '-':
+            print(output)
+        else:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                file.write(output)
+            print(f'Отчет сохранен в {options["output"]}')
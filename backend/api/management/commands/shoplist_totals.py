@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShopListIngredient
+from recipes.utils import get_expected_shoplist_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка таблицы сумм ингредиентов в списках покупок с рецептами '
+        'в корзинах пользователей и исправление расхождений. '
+        'Только проверка без исправления: '
+        'python manage.py shoplist_totals --verify'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='только вывести расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = get_expected_shoplist_totals()
+            actual = {
+                (shopper_id, ingredient_id): (pk, amount)
+                for pk, shopper_id, ingredient_id, amount
+                in ShopListIngredient.objects.values_list(
+                    'id', 'shopper_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            missing = [key for key in expected if key not in actual]
+            extra = [pk for key, (pk, _) in actual.items()
+                     if key not in expected]
+            changed = [
+                (pk, expected[key]) for key, (pk, amount) in actual.items()
+                if key in expected and expected[key] != amount
+            ]
+            print(
+                f'Отсутствует строк: {len(missing)}, '
+                f'лишних строк: {len(extra)}, '
+                f'неверных сумм: {len(changed)}'
+            )
+            if options['verify'] or not (missing or extra or changed):
+                return
+
+            ShopListIngredient.objects.filter(id__in=extra).delete()
+            ShopListIngredient.objects.bulk_update(
+                [
+                    ShopListIngredient(id=pk, amount=amount)
+                    for pk, amount in changed
+                ],
+                ['amount'],
+                batch_size=500,
+            )
+            ShopListIngredient.objects.bulk_create(
+                [
+                    ShopListIngredient(
+                        shopper_id=shopper_id,
+                        ingredient_id=ingredient_id,
+                        amount=expected[(shopper_id, ingredient_id)],
+                    )
+                    for shopper_id, ingredient_id in missing
+                ]
+            )
+        print('Расхождения исправлены')
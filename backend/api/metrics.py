@@ -0,0 +1,322 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework.serializers import ListSerializer
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+HISTOGRAMS = {
+    'request_duration_seconds': ('Время обработки запроса', DURATION_BUCKETS),
+    'sql_duration_seconds': ('Время SQL-запросов', DURATION_BUCKETS),
+    'view_duration_seconds': ('Время view, включая рендеринг ответа',
+                              DURATION_BUCKETS),
+    'serializer_duration_seconds': ('Время сериализации без SQL',
+                                    DURATION_BUCKETS),
+    'render_duration_seconds': ('Время рендеринга ответа', DURATION_BUCKETS),
+    'image_duration_seconds': ('Время обработки изображений',
+                               DURATION_BUCKETS),
+    'sql_queries': ('Количество SQL-запросов', QUERY_BUCKETS),
+}
+WORKERS_KEY = 'metrics:workers'
+WORKERS_LOCK_KEY = 'metrics:workers:lock'
+
+_local = threading.local()
+
+
+class Registry:
+    '''Гистограммы процесса: {(метрика, view): [счетчики корзин, сумма]}.
+    Раз в METRICS_FLUSH_INTERVAL секунд снимок выгружается в кэш на
+    METRICS_WORKER_TTL секунд, чтобы эндпойнт метрик мог сложить данные
+    всех процессов. Снимки завершившихся процессов истекают, и они
+    удаляются из списка процессов.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.reset()
+
+    def reset(self):
+        '''Процесс, созданный через fork, начинает с пустых гистограмм
+        и собственного ключа: pid может повториться после перезапуска.'''
+        self.pid = os.getpid()
+        self.key = f'metrics:{self.pid}:{uuid4().hex}'
+        self.data = {}
+        self.flushed_at = time.monotonic()
+
+    def observe(self, view, values):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                counts, total = self.data.get(
+                    (name, view), ([0] * (len(buckets) + 1), 0)
+                )
+                counts[bisect_left(buckets, value)] += 1
+                self.data[(name, view)] = (counts, total + value)
+
+    def snapshot(self):
+        with self.lock:
+            return {key: (list(counts), total)
+                    for key, (counts, total) in self.data.items()}
+
+    def flush(self, force=False):
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and time.monotonic() - self.flushed_at < interval:
+            return
+        self.flushed_at = time.monotonic()
+        cache.set(
+            self.key, self.snapshot(), timeout=settings.METRICS_WORKER_TTL
+        )
+        if self.key not in (cache.get(WORKERS_KEY) or ()):
+            update_workers(lambda workers: workers | {self.key})
+
+
+def update_workers(change):
+    '''Меняет список процессов под блокировкой cache.add: без нее два
+    процесса, одновременно дописавшие себя, затирают друг друга. Если
+    блокировка занята, процесс допишет себя при следующей выгрузке.'''
+    if not cache.add(WORKERS_LOCK_KEY, os.getpid(), timeout=5):
+        return
+    try:
+        workers = set(cache.get(WORKERS_KEY) or ())
+        cache.set(WORKERS_KEY, change(workers), timeout=None)
+    finally:
+        cache.delete(WORKERS_LOCK_KEY)
+
+
+registry = Registry()
+
+
+class RequestTimer:
+    '''Замеры одного запроса: время этапов и количество SQL-запросов.'''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.timings = {}
+        self.active = set()
+        self.queries = 0
+
+    def add(self, name, value):
+        self.timings[name] = self.timings.get(name, 0) + value
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('sql', time.perf_counter() - start)
+            self.queries += 1
+
+    @contextmanager
+    def measure(self):
+        '''Замеры внутри блока относятся к этому запросу.'''
+        _local.timer = self
+        try:
+            with connection.execute_wrapper(self.sql_wrapper):
+                yield
+        finally:
+            _local.timer = None
+
+
+@contextmanager
+def stage(name):
+    '''Добавляет время выполнения блока к этапу name текущего запроса.
+    Вложенные блоки одного этапа не учитываются повторно. Время
+    SQL-запросов внутри блока относится только к этапу sql, иначе
+    сериализацию с ленивыми запросами нельзя отличить от работы базы.'''
+    timer = getattr(_local, 'timer', None)
+    if timer is None or name in timer.active:
+        yield
+        return
+    timer.active.add(name)
+    start = time.perf_counter()
+    sql = timer.timings.get('sql', 0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timer.add(name, elapsed - (timer.timings.get('sql', 0) - sql))
+        timer.active.discard(name)
+
+
+class TimedRendererMixin:
+    '''Засекает время рендеринга ответа DRF.'''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with stage('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedSerializerMixin:
+    '''Засекает время преобразования объектов в данные ответа.'''
+
+    def to_representation(self, instance):
+        with stage('serializer'):
+            return super().to_representation(instance)
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+class TimedBase64ImageField(Base64ImageField):
+    '''Засекает время декодирования и проверки изображения.'''
+
+    def to_internal_value(self, data):
+        with stage('image'):
+            return super().to_internal_value(data)
+
+
+def get_view_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    '''Считает для каждого запроса количество и время SQL-запросов,
+    время view и рендеринга и общее время, отдает их в заголовке
+    Server-Timing и накапливает в гистограммах по view и action.
+    Тело потокового ответа формируется уже после выхода из middleware,
+    поэтому его запросы считаются при чтении потока, а гистограммы
+    обновляются, когда поток закончится.'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_name(request, view_func)
+        timer = getattr(_local, 'timer', None)
+        if timer is not None:
+            timer.view_start = time.perf_counter()
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        with timer.measure():
+            response = self.get_response(request)
+        end = time.perf_counter()
+        if timer.view_start is not None:
+            timer.add('view', end - timer.view_start)
+
+        response['Server-Timing'] = ', '.join(
+            [f'sql;desc="{timer.queries} queries";'
+             f'dur={timer.timings.get("sql", 0) * 1000:.1f}']
+            + [f'{name};dur={value * 1000:.1f}'
+               for name, value in timer.timings.items() if name != 'sql']
+            + [f'total;dur={(end - timer.start) * 1000:.1f}']
+        )
+        view = getattr(request, 'metrics_view', 'unmatched')
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                response.streaming_content, timer, view
+            )
+        else:
+            self.observe(timer, view, end)
+        return response
+
+    def measure_stream(self, content, timer, view):
+        try:
+            with timer.measure():
+                yield from content
+        finally:
+            self.observe(timer, view, time.perf_counter())
+
+    def observe(self, timer, view, end):
+        values = {
+            'request_duration_seconds': end - timer.start,
+            'sql_duration_seconds': timer.timings.get('sql', 0),
+            'sql_queries': timer.queries,
+        }
+        for name in ('view', 'serializer', 'render', 'image'):
+            if name in timer.timings:
+                values[f'{name}_duration_seconds'] = timer.timings[name]
+        registry.observe(view, values)
+        registry.flush()
+
+
+def collect():
+    '''Складывает снимки всех процессов, текущий берется без задержки.
+    Процессы с истекшим снимком удаляются из списка.'''
+    registry.flush(force=True)
+    workers = cache.get(WORKERS_KEY) or ()
+    snapshots = cache.get_many(workers)
+    dead = set(workers) - set(snapshots)
+    if dead:
+        update_workers(lambda workers: workers - dead)
+    merged = {}
+    for snapshot in snapshots.values():
+        for key, (counts, total) in snapshot.items():
+            merged_counts, merged_total = merged.get(
+                key, ([0] * len(counts), 0)
+            )
+            merged[key] = (
+                [left + right for left, right in zip(merged_counts, counts)],
+                merged_total + total,
+            )
+    return merged
+
+
+def render_prometheus(data):
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        metric = f'foodgram_{name}'
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (histogram, view), (counts, total) in sorted(data.items()):
+            if histogram != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(
+                    f'{metric}_bucket{{view="{view}",le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(f'{metric}_sum{{view="{view}"}} {total}')
+            lines.append(f'{metric}_count{{view="{view}"}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+@lru_cache(maxsize=None)
+def get_allowed_networks():
+    return [
+        ip_network(value.strip())
+        for value in settings.METRICS_ALLOWED_IPS if value.strip()
+    ]
+
+
+def is_allowed(address):
+    '''METRICS_ALLOWED_IPS - адреса или сети, например 172.16.0.0/12
+    для контейнеров docker.'''
+    try:
+        address = ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in get_allowed_networks())
+
+
+def metrics_view(request):
+    if not is_allowed(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                quote_etag)
+
+from recipes.utils import get_table_version
+
+
+class TableVersionETagMixin:
+    '''Условный GET для общедоступных справочников. ETag - версия
+    таблицы модели etag_model, она меняется при каждой записи в таблицу.
+    Если версия совпала с If-None-Match, отдается 304 без запроса
+    к базе и сериализации.'''
+
+    etag_model = None
+
+    def get_etag(self):
+        return quote_etag(get_table_version(self.etag_model))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.REFERENCE_DATA_MAX_AGE,
+            )
+        return response
@@ -1,5 +1,303 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.utils import get_feed_cache_key
 
 
 class LimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class ApproximateCountPaginator(Paginator):
+    '''Считает записи точно, только если их не больше
+    PAGINATION_EXACT_COUNT_LIMIT: подсчет ограничен подзапросом с LIMIT.
+    Для больших выборок без фильтров берется оценка планировщика
+    PostgreSQL, для остальных - точное число из кэша, которое живет
+    PAGINATION_COUNT_CACHE_TIMEOUT секунд для каждого набора фильтров.'''
+    is_approximate = False
+
+    @cached_property
+    def count(self):
+        limit = settings.PAGINATION_EXACT_COUNT_LIMIT
+        queryset = self.object_list.values('pk').order_by()
+        count = queryset[:limit + 1].count()
+        if count <= limit:
+            return count
+        self.is_approximate = True
+        estimate = self.get_planner_estimate(queryset)
+        if estimate is not None and estimate > limit:
+            return estimate
+        return self.get_cached_count(queryset)
+
+    def get_planner_estimate(self, queryset):
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+
+    def get_cached_count(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        key = 'count:' + md5(f'{sql}{params}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(
+                key, count, timeout=settings.PAGINATION_COUNT_CACHE_TIMEOUT
+            )
+        return count
+
+    def validate_number(self, number):
+        '''При приблизительном количестве последние страницы
+        не запрещаются, лишняя страница просто окажется пустой.'''
+        if not (self.count and self.is_approximate):
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы должен быть больше нуля')
+        return number
+
+    def page(self, number):
+        if not self.is_approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+
+class ApproximateCountPagination(LimitPagination):
+    '''Пагинация с номерами страниц, в которой count может быть
+    приблизительным, о чем сообщает поле count_is_approximate.'''
+    django_paginator_class = ApproximateCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_approximate', self.page.paginator.is_approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class CursorPaginationMixin:
+    '''Пагинация по ключу (поле ключа, id): записи выбираются без COUNT
+    и OFFSET, поэтому любая страница стоит столько же, сколько первая.
+    По умолчанию ключ - key_field по убыванию. В ответе только next,
+    previous и results, курсоры непрозрачные.'''
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    key_field = 'pub_date'
+
+    def get_cursor_ordering(self, request):
+        '''Поле ключа и признак сортировки по убыванию.'''
+        return self.key_field, True
+
+    def parse_key(self, value):
+        return datetime.fromisoformat(value)
+
+    def format_key(self, value):
+        return value.isoformat()
+
+    def paginate_by_cursor(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        key, descending = self.get_cursor_ordering(request)
+        self.cursor_key = key
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+        # Назад по страницам - тот же ключ в обратном порядке.
+        descending = descending != reverse
+        if cursor is not None:
+            value, pk, _ = cursor
+            if descending:
+                queryset = queryset.filter(**{f'{key}__lte': value}).exclude(
+                    **{key: value, 'id__gte': pk}
+                )
+            else:
+                queryset = queryset.filter(**{f'{key}__gte': value}).exclude(
+                    **{key: value, 'id__lte': pk}
+                )
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{key}', f'{prefix}id')
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.results = results
+        return results
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk, reverse = b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii').split('|')
+            return self.parse_key(value), int(pk), reverse == '1'
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        value = self.format_key(getattr(obj, self.cursor_key))
+        cursor = f'{value}|{obj.id}|{int(reverse)}'
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            b64encode(cursor.encode('ascii')).decode('ascii'),
+        )
+
+    def get_cursor_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], reverse=False)
+
+    def get_cursor_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.results:
+            return replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, ''
+            )
+        return self.encode_cursor(self.results[0], reverse=True)
+
+    def get_cursor_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_cursor_next_link()),
+            ('previous', self.get_cursor_previous_link()),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(CursorPaginationMixin, ApproximateCountPagination):
+    '''Постраничная пагинация рецептов. С параметром ?cursor (в том числе
+    пустым) включается режим курсора по ключу (pub_date, id) или по полю
+    из ?ordering и id. При поиске курсор не используется: результаты идут
+    по релевантности, а не по ключу, поэтому остается пагинация со
+    смещением.'''
+    search_query_param = 'search'
+    ordering_query_param = 'ordering'
+    counter_fields = ('favorites_count', 'shopping_cart_count')
+
+    def get_cursor_ordering(self, request):
+        fields = [
+            field.strip() for field in request.query_params.get(
+                self.ordering_query_param, ''
+            ).split(',') if field.strip()
+        ]
+        if not fields:
+            return super().get_cursor_ordering(request)
+        key = fields[0].lstrip('-')
+        allowed = (self.key_field,) + self.counter_fields
+        if len(fields) > 1 or key not in allowed:
+            raise ValidationError({self.ordering_query_param: (
+                'В режиме курсора сортировка возможна только по одному '
+                'полю: pub_date, favorites_count или shopping_cart_count'
+            )})
+        return key, fields[0].startswith('-')
+
+    def parse_key(self, value):
+        if self.cursor_key in self.counter_fields:
+            return int(value)
+        return super().parse_key(value)
+
+    def format_key(self, value):
+        if self.cursor_key in self.counter_fields:
+            return str(value)
+        return super().format_key(value)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            and not request.query_params.get(
+                self.search_query_param, ''
+            ).strip()
+        )
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_by_cursor(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return self.get_cursor_response(data)
+
+
+class KeysetPagination(CursorPaginationMixin, LimitPagination):
+    '''Пагинация только по курсору, для лент без номеров страниц.'''
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_by_cursor(queryset, request)
+
+    def get_paginated_response(self, data):
+        return self.get_cursor_response(data)
+
+
+class TrendingPagination(KeysetPagination):
+    '''Пагинация популярных рецептов: ключ - рейтинг trending_score,
+    который аннотирует представление.'''
+    key_field = 'trending_score'
+
+    def parse_key(self, value):
+        return float(value)
+
+    def format_key(self, value):
+        return repr(value)
+
+
+class FeedPagination(KeysetPagination):
+    '''Лента рецептов авторов из подписок. Первая страница хранится
+    в кэше как список id: ключ меняется, когда кто-то из авторов
+    публикует или удаляет рецепт и когда меняются подписки, поэтому
+    часто открываемые ленты не пересчитываются между публикациями.'''
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.cursor_query_param):
+            return super().paginate_queryset(queryset, request, view)
+        key = get_feed_cache_key(request.user.id, self.get_page_size(request))
+        cached = cache.get(key)
+        if cached is None:
+            results = super().paginate_queryset(queryset, request, view)
+            cache.set(
+                key,
+                ([recipe.id for recipe in results], self.has_next),
+                timeout=settings.FEED_CACHE_TIMEOUT,
+            )
+            return results
+        recipe_ids, self.has_next = cached
+        self.request = request
+        self.has_previous = False
+        recipes = queryset.in_bulk(recipe_ids)
+        self.results = [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
+        return self.results
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.models import Ingredient, IngredientsForRecipe, Tag
+from recipes.utils import get_recipe_versions, get_table_version
+
+RECIPE_PREFETCH = (
+    'author',
+    'tags',
+    Prefetch(
+        'ingredients_used',
+        queryset=IngredientsForRecipe.objects.select_related('ingredient')
+    ),
+)
+
+
+def get_cache_keys(recipes):
+    '''Ключ включает версию рецепта и версии таблиц тегов
+    и ингредиентов: их изменение затрагивает все рецепты.'''
+    prefix = (
+        f'recipe:{get_table_version(Tag)}:{get_table_version(Ingredient)}'
+    )
+    versions = get_recipe_versions([recipe.id for recipe in recipes])
+    return {
+        recipe.id: f'{prefix}:{recipe.id}:{versions[recipe.id]}'
+        for recipe in recipes
+    }
+
+
+def get_cached_representations(recipes, represent):
+    '''Возвращает представления рецептов в порядке recipes. Чего нет
+    в кэше, считается функцией represent после подгрузки автора,
+    тегов и ингредиентов одной пачкой на все промахи.'''
+    keys = get_cache_keys(recipes)
+    cached = cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    if missing:
+        prefetch_related_objects(missing, *RECIPE_PREFETCH)
+        fresh = {keys[recipe.id]: represent(recipe) for recipe in missing}
+        cache.set_many(fresh, timeout=settings.RECIPE_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[keys[recipe.id]] for recipe in recipes]
@@ -0,0 +1,49 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import (BaseRenderer, BrowsableAPIRenderer,
+                                      JSONRenderer)
+
+from api.metrics import TimedRendererMixin
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+class PlainTextRenderer(BaseRenderer):
+    '''Рендерер нужен, чтобы DRF принимал ?format=txt. Сам файл
+    отдается потоком в обход рендерера, здесь выводятся только ошибки.'''
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class FormatNegotiation(DefaultContentNegotiation):
+    '''Для неизвестного ?format= DRF отвечает 404, здесь вместо этого
+    400 со списком поддерживаемых форматов.'''
+
+    def filter_renderers(self, renderers, format):
+        filtered = [
+            renderer for renderer in renderers if renderer.format == format
+        ]
+        if not filtered:
+            raise ValidationError({
+                'format': f'Неподдерживаемый формат {format}, доступны: '
+                + ', '.join(renderer.format for renderer in renderers)
+            })
+        return filtered
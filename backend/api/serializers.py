@@ -1,14 +1,22 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers as s
 from rest_framework.relations import SlugRelatedField
 
+from api.metrics import (TimedBase64ImageField, TimedListSerializer,
+                         TimedSerializerMixin)
+from api.recipe_cache import get_cached_representations
+from api.utils import get_recipes_limit
+from recipes.images import get_variant_urls
 from recipes.models import (FavouriteRecipes, Ingredient, IngredientsForRecipe,
                             Recipe, ShopList, Tag)
+from recipes.utils import update_recipe_in_shoplists
 from users.models import Subscriptions, User
 
 
-class ModifiedUserSerializer(UserSerializer):
+class ModifiedUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = s.SerializerMethodField()
 
     class Meta:
@@ -21,21 +29,58 @@ class ModifiedUserSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
         )
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
-        if not user.is_authenticated:
+        if not user.is_authenticated or user == obj:
             return False
+        subscribed_authors = self.context.get('subscribed_authors')
+        if subscribed_authors is not None:
+            return obj.id in subscribed_authors
         return Subscriptions.objects.filter(user=user, author=obj).exists()
 
 
+def get_image_urls(recipe, request=None):
+    '''Ссылки на уменьшенные копии изображения рецепта, None пока
+    фоновая обработка не завершена.'''
+    urls = get_variant_urls(recipe)
+    if urls is None or request is None:
+        return urls
+    return {
+        variant: {
+            extension: request.build_absolute_uri(url)
+            for extension, url in formats.items()
+        }
+        for variant, formats in urls.items()
+    }
+
+
+def get_image_url(recipe, variant, request=None):
+    '''Ссылка на JPEG-копию нужного размера или на оригинал.'''
+    urls = get_image_urls(recipe, request)
+    if urls is not None:
+        return urls[variant]['jpeg']
+    if not recipe.image:
+        return None
+    url = recipe.image.url
+    return request.build_absolute_uri(url) if request else url
+
+
 class RecipeMiniSerializer(s.ModelSerializer):
+    image = s.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_image(self, obj):
+        return get_image_url(obj, 'thumbnail', self.context.get('request'))
 
-class SubscriptionsSerializer(s.ModelSerializer):
+
+class SubscriptionsSerializer(TimedSerializerMixin, s.ModelSerializer):
     email = s.ReadOnlyField(source='author.email')
     id = s.ReadOnlyField(source='author.id')
     username = s.ReadOnlyField(source='author.username')
@@ -43,7 +88,7 @@ class SubscriptionsSerializer(s.ModelSerializer):
     last_name = s.ReadOnlyField(source='author.last_name')
     is_subscribed = s.SerializerMethodField()
     recipes = s.SerializerMethodField()
-    recipes_count = s.IntegerField(source='author.recipes.count')
+    recipes_count = s.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Subscriptions
@@ -57,27 +102,20 @@ class SubscriptionsSerializer(s.ModelSerializer):
             'recipes',
             'recipes_count',
         )
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
-        if not user.is_authenticated:
-            return False
-        return Subscriptions.objects.filter(
-            user=user,
-            author=obj.author
-        ).exists()
+        return obj.user_id == user.id
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.author)
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        try:
-            if recipes_limit and int(recipes_limit) > 0:
-                queryset = queryset[:int(recipes_limit)]
-        except (ValueError, TypeError):
-            raise s.ValidationError(
-                'recipes_limit должен быть целым положительным числом'
-            )
+        if hasattr(obj, 'recipes_preview'):
+            queryset = obj.recipes_preview
+        else:
+            queryset = Recipe.objects.filter(author=obj.author)
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit:
+                queryset = queryset[:recipes_limit]
         return RecipeMiniSerializer(queryset, read_only=True, many=True).data
 
 
@@ -108,10 +146,11 @@ class SubscribeSerializer(s.ModelSerializer):
         return data
 
 
-class TagSerializer(s.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, s.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
+        list_serializer_class = TimedListSerializer
 
 
 class TagFieldSerializer(SlugRelatedField):
@@ -121,10 +160,11 @@ class TagFieldSerializer(SlugRelatedField):
         return serializer.data
 
 
-class IngredientSerializer(s.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, s.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
+        list_serializer_class = TimedListSerializer
 
 
 class IngredientForRecipeSerializer(s.ModelSerializer):
@@ -137,12 +177,33 @@ class IngredientForRecipeSerializer(s.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class AddIngredientListSerializer(s.ListSerializer):
+    '''Ищет все ингредиенты рецепта одним запросом вместо запроса
+    на каждый элемент списка.'''
+
+    def validate(self, attrs):
+        ingredients = Ingredient.objects.in_bulk(
+            {item['id'] for item in attrs}
+        )
+        missing = [item['id'] for item in attrs
+                   if item['id'] not in ingredients]
+        if missing:
+            raise s.ValidationError(
+                f'Недопустимый первичный ключ "{missing[0]}" - '
+                'объект не существует.'
+            )
+        for item in attrs:
+            item['id'] = ingredients[item['id']]
+        return attrs
+
+
 class AddIngredientForRecipeSerializer(s.ModelSerializer):
-    id = s.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = s.IntegerField()
 
     class Meta:
         model = IngredientsForRecipe
         fields = ('id', 'amount')
+        list_serializer_class = AddIngredientListSerializer
 
     def validate_amount(self, value):
         if value < 1:
@@ -152,7 +213,14 @@ class AddIngredientForRecipeSerializer(s.ModelSerializer):
         return value
 
 
-class RecipeSerializer(s.ModelSerializer):
+class RecipeListSerializer(TimedListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return self.child.to_representation_many(recipes, variant='card')
+
+
+class RecipeSerializer(TimedSerializerMixin, s.ModelSerializer):
     tags = TagFieldSerializer(
         slug_field='id',
         queryset=Tag.objects.all(),
@@ -165,7 +233,7 @@ class RecipeSerializer(s.ModelSerializer):
     )
     is_favorited = s.SerializerMethodField()
     is_in_shopping_cart = s.SerializerMethodField()
-    image = Base64ImageField()
+    image = TimedBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -181,8 +249,51 @@ class RecipeSerializer(s.ModelSerializer):
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes, variant='full'):
+        '''Общая для всех пользователей часть рецепта берется из кэша,
+        поверх нее проставляются поля, зависящие от запроса.
+        В image отдается копия изображения размера variant.'''
+        for recipe in recipes:
+            # Флаги считаются один раз, в том числе для промаха кэша.
+            recipe.is_favorited = self.get_is_favorited(recipe)
+            recipe.is_in_shopping_cart = self.get_is_in_shopping_cart(recipe)
+        representations = get_cached_representations(
+            recipes, super().to_representation
+        )
+        request = self.context.get('request')
+        for recipe, data in zip(recipes, representations):
+            data['author']['is_subscribed'] = self.get_author_subscribed(
+                recipe
+            )
+            data['is_favorited'] = recipe.is_favorited
+            data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+            # Счетчики меняются без сброса кэша рецепта.
+            data['favorites_count'] = recipe.favorites_count
+            data['shopping_cart_count'] = recipe.shopping_cart_count
+            data['image'] = get_image_url(recipe, variant, request)
+            data['image_variants'] = get_image_urls(recipe, request)
+        return representations
+
+    def get_author_subscribed(self, obj):
+        user = self.context.get('request').user
+        if not user.is_authenticated or user.id == obj.author_id:
+            return False
+        subscribed_authors = self.context.get('subscribed_authors')
+        if subscribed_authors is not None:
+            return obj.author_id in subscribed_authors
+        return Subscriptions.objects.filter(
+            user=user,
+            author_id=obj.author_id
+        ).exists()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
@@ -192,6 +303,8 @@ class RecipeSerializer(s.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
@@ -210,7 +323,7 @@ class AddRecipeSerializer(s.ModelSerializer):
     )
     author = ModifiedUserSerializer(read_only=True)
     ingredients = AddIngredientForRecipeSerializer(many=True)
-    image = Base64ImageField()
+    image = TimedBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -228,11 +341,12 @@ class AddRecipeSerializer(s.ModelSerializer):
         serializer = RecipeSerializer(instance, context=self.context)
         return serializer.data
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredient_data = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        recipe.tags.add(*tags)
         IngredientsForRecipe.objects.bulk_create(
             [
                 IngredientsForRecipe(
@@ -245,31 +359,57 @@ class AddRecipeSerializer(s.ModelSerializer):
         )
         return recipe
 
-    def update(self, instance, validated_data):
-        if validated_data.get('tags'):
-            tags = validated_data.pop('tags')
-            instance.tags.clear()
-            instance.tags.set(tags)
-
-        if not validated_data.get('ingredients'):
-            return super().update(instance, validated_data)
-
-        ingredient_data = validated_data.pop('ingredients')
-        old_ingredients = (
-            IngredientsForRecipe.objects.filter(recipe=instance)
-        )
-        for item in old_ingredients:
-            item.delete()
+    def update_ingredients(self, instance, ingredient_data):
+        '''Сравнивает новый состав рецепта с текущим: удаленные
+        ингредиенты удаляются одним запросом, измененные количества
+        обновляются одним запросом, новые добавляются одним запросом.'''
+        current = {
+            item.ingredient_id: item
+            for item in IngredientsForRecipe.objects.filter(recipe=instance)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        new_amounts = {
+            item['id'].id: item['amount'] for item in ingredient_data
+        }
+        removed = [
+            item.id for ingredient_id, item in current.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            IngredientsForRecipe.objects.filter(id__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            item = current.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        IngredientsForRecipe.objects.bulk_update(changed, ['amount'])
         IngredientsForRecipe.objects.bulk_create(
             [
                 IngredientsForRecipe(
                     recipe=instance,
-                    ingredient=item['id'],
-                    amount=item['amount']
+                    ingredient_id=ingredient_id,
+                    amount=amount
                 )
-                for item in ingredient_data
+                for ingredient_id, amount in new_amounts.items()
+                if ingredient_id not in current
             ]
         )
+        update_recipe_in_shoplists(instance.id, old_amounts, new_amounts)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        if 'image' in validated_data:
+            validated_data['variants_version'] = ''
+        if validated_data.get('tags'):
+            instance.tags.set(validated_data.pop('tags'))
+        if validated_data.get('ingredients'):
+            self.update_ingredients(
+                instance, validated_data.pop('ingredients')
+            )
         return super().update(instance, validated_data)
 
     def validate_cooking_time(self, value):
@@ -293,6 +433,14 @@ class AddRecipeSerializer(s.ModelSerializer):
         return data
 
 
+class RecipeIdsSerializer(s.Serializer):
+    recipes = s.ListField(
+        child=s.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+
 class FavouriteRecipeSerializer(s.ModelSerializer):
 
     class Meta:
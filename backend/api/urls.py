@@ -2,18 +2,18 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views import (IngredientViewSet, RecipeViewSet, SubscribeView,
-                       SubsriptionsView, TagViewSet)
+                       SubsriptionsView, TagViewSet, UserViewSet)
 
 router = DefaultRouter()
 
 router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 router.register('recipes', RecipeViewSet)
+router.register('users', UserViewSet)
 
 urlpatterns = [
-    path('', include(router.urls)),
     path('users/subscriptions/', SubsriptionsView.as_view()),
-    path('', include('djoser.urls')),
+    path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
     path(r'users/<int:id>/subscribe/', SubscribeView.as_view()),
 ]
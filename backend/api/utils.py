@@ -1,18 +1,117 @@
+import csv
+import json
+import os
+from collections import defaultdict
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import Recipe
+
+
+class Echo:
+    '''Псевдо-буфер для csv.writer: возвращает строку вместо записи.'''
+
+    def write(self, value):
+        return value
 
 
 def convert_to_txt(shoplist):
-    file_name = settings.SHOPLIST_FILE_NAME
-    lines = []
     for item in shoplist:
         name = item['ingredient__name']
         measurement_unit = item['ingredient__measurement_unit']
         amount = item['ingredient_total']
-        lines.append(f'{name} - {amount} {measurement_unit}')
-    lines.append('\nПриятного аппетита! Ваш FoodGram')
-    content = '\n'.join(lines)
-    content_type = 'text/plain,charset=utf8'
-    response = HttpResponse(content, content_type=content_type)
-    response['Content-Disposition'] = f'attachment; filename={file_name}'
+        yield f'{name} - {amount} {measurement_unit}\n'
+    yield '\nПриятного аппетита! Ваш FoodGram'
+
+
+def convert_to_csv(shoplist):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Ед.измерения'))
+    for item in shoplist:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient_total'],
+            item['ingredient__measurement_unit'],
+        ))
+
+
+def convert_to_json(shoplist):
+    separator = ''
+    yield '['
+    for item in shoplist:
+        line = json.dumps(
+            {
+                'name': item['ingredient__name'],
+                'amount': item['ingredient_total'],
+                'measurement_unit': item['ingredient__measurement_unit'],
+            },
+            ensure_ascii=False,
+        )
+        yield f'{separator}\n{line}'
+        separator = ','
+    yield '\n]'
+
+
+SHOPLIST_FORMATS = {
+    'txt': (convert_to_txt, 'text/plain; charset=utf-8'),
+    'csv': (convert_to_csv, 'text/csv; charset=utf-8'),
+    'json': (convert_to_json, 'application/json; charset=utf-8'),
+}
+
+
+def shoplist_response(shoplist, file_format='txt'):
+    '''Отдает список покупок потоком: строки формируются по мере
+    чтения агрегированного queryset, файл целиком в памяти не хранится.'''
+    convert, content_type = SHOPLIST_FORMATS[file_format]
+    file_name = os.path.splitext(settings.SHOPLIST_FILE_NAME)[0]
+    response = StreamingHttpResponse(
+        convert(shoplist.iterator()),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename={file_name}.{file_format}'
+    )
     return response
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    try:
+        if recipes_limit and int(recipes_limit) > 0:
+            return int(recipes_limit)
+    except (ValueError, TypeError):
+        raise ValidationError(
+            'recipes_limit должен быть целым положительным числом'
+        )
+    return None
+
+
+def get_recent_recipes(author_ids, limit=None):
+    '''Возвращает словарь {id автора: список его последних рецептов}.
+    Рецепты всех авторов выбираются одним запросом: ROW_NUMBER()
+    нумерует рецепты внутри каждого автора, а внешний запрос
+    оставляет не больше limit рецептов на автора.'''
+    recipes = defaultdict(list)
+    if not author_ids:
+        return recipes
+    queryset = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )
+    ).order_by()
+    sql, params = queryset.query.sql_with_params()
+    sql = f'SELECT * FROM ({sql}) AS ranked'
+    if limit:
+        sql += ' WHERE ranked.row_number <= %s'
+        params = (*params, limit)
+    sql += ' ORDER BY ranked.author_id, ranked.row_number'
+
+    for recipe in Recipe.objects.raw(sql, params):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
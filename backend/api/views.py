@@ -1,36 +1,80 @@
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from api import serializers as s
-from api.filters import IngredientFilter, RecipeFilter
+from api.filters import IngredientFilter, RecipeFilter, SubscriptionFilter
+from api.ingredient_index import ingredient_index
+from api.mixins import TableVersionETagMixin
+from api.pagination import FeedPagination, RecipePagination, TrendingPagination
 from api.permissions import IsOwnerOrReadOnly
-from api.utils import convert_to_txt
-from recipes.models import (FavouriteRecipes, Ingredient, IngredientsForRecipe,
-                            Recipe, ShopList, Tag)
+from api.renderers import CSVRenderer, FormatNegotiation, PlainTextRenderer
+from api.utils import get_recent_recipes, get_recipes_limit, shoplist_response
+from recipes.models import (FavouriteRecipes, Ingredient, Recipe, ShopList,
+                            ShopListIngredient, Tag)
+from recipes.utils import (add_to_list, apply_shoplist_delta, change_counter,
+                           get_followed_author_ids, get_recipes_amounts,
+                           remove_from_list)
 from users.models import Subscriptions, User
 
+# Действия RecipeViewSet, отдающие рецепты через RecipeSerializer.
+READ_ACTIONS = ('list', 'retrieve', 'trending', 'feed')
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class UserViewSet(DjoserUserViewSet):
+
+    def get_queryset(self):
+        '''Флаг подписки считаем в том же запросе, что и список
+        пользователей, а не отдельным запросом на каждого.'''
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_subscribed=Exists(Subscriptions.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        )
+
+
+class TagViewSet(TableVersionETagMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
+    etag_model = Tag
     serializer_class = s.TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(TableVersionETagMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
+    etag_model = Ingredient
     serializer_class = s.IngredientSerializer
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            ingredients = ingredient_index.search(name)
+            if ingredients is not None:
+                return Response(ingredients)
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
@@ -38,9 +82,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsOwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        '''Для чтения аннотируем флаги текущего пользователя. Автор,
+        теги и ингредиенты подгружаются сериализатором только для
+        рецептов, которых нет в кэше.'''
+        queryset = super().get_queryset()
+        if self.action not in READ_ACTIONS:
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(FavouriteRecipes.objects.filter(
+                fan_user=user, fav_recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShopList.objects.filter(
+                shopper=user, recipe_to_shop=OuterRef('pk')
+            )),
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user = self.request.user
+        if self.action in READ_ACTIONS and user.is_authenticated:
+            context['subscribed_authors'] = get_followed_author_ids(user.id)
+        return context
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in READ_ACTIONS:
             return s.RecipeSerializer
         return s.AddRecipeSerializer
 
@@ -124,30 +198,154 @@ class RecipeViewSet(viewsets.ModelViewSet):
         model = ShopList
         return self.get_object_deleted(data=data, model=model)
 
+    @transaction.atomic
+    def batch_update(self, request, model, user_field, recipe_field,
+                     counter):
+        '''Добавляет (POST) или удаляет (DELETE) сразу несколько рецептов
+        в списке пользователя: одно чтение рецептов, одна вставка или одно
+        удаление. Изменившимися считаются только строки, которые вставил
+        или удалил этот запрос, поэтому параллельные одинаковые запросы
+        не меняют счетчики и список покупок дважды. Для каждого
+        переданного id возвращается свой результат.'''
+        serializer = s.RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(
+            serializer.validated_data['recipes']
+        ))
+        user = request.user
+        recipes = Recipe.objects.filter(id__in=recipe_ids).in_bulk()
+        adding = request.method == 'POST'
+        write = add_to_list if adding else remove_from_list
+        # Сигналы не отправляются: счетчик рецептов и суммы в списке
+        # покупок меняются ниже одним вызовом.
+        changed = write(
+            model, user_field, recipe_field, user.id, list(recipes)
+        )
+        if changed:
+            change_counter(Recipe, changed, counter, 1 if adding else -1)
+        if model is ShopList and changed:
+            amounts = get_recipes_amounts(changed)
+            sign = 1 if adding else -1
+            apply_shoplist_delta([user.id], {
+                ingredient_id: sign * amount
+                for ingredient_id, amount in amounts.items()
+            })
+
+        statuses = ('added', 'exists') if adding else ('removed', 'missing')
+        results = []
+        for recipe_id in recipe_ids:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                results.append({'id': recipe_id, 'status': 'not_found'})
+                continue
+            results.append({
+                'id': recipe_id,
+                'status': statuses[recipe_id not in changed],
+                'recipe': s.RecipeMiniSerializer(
+                    recipe, context=self.get_serializer_context()
+                ).data,
+            })
+        return Response(results)
+
     @action(
-        methods=['get', ],
+        methods=['post', 'delete'],
         detail=False,
+        url_path='favorite/batch',
         permission_classes=(IsAuthenticated,)
     )
+    def favorite_batch(self, request):
+        return self.batch_update(
+            request, FavouriteRecipes, 'fan_user', 'fav_recipe',
+            'favorites_count'
+        )
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_update(
+            request, ShopList, 'shopper', 'recipe_to_shop',
+            'shopping_cart_count'
+        )
+
+    @action(
+        methods=['get'],
+        detail=False,
+        pagination_class=TrendingPagination,
+    )
+    def trending(self, request):
+        '''Популярные рецепты по таблице рейтинга, которую пересчитывает
+        refresh_trending. Фильтры списка рецептов тоже работают.'''
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            ranking__isnull=False
+        ).annotate(trending_score=F('ranking__score'))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        '''Рецепты авторов из подписок пользователя, сначала новые:
+        один запрос с полусоединением по подпискам, который использует
+        индекс (author, -pub_date, -id).'''
+        queryset = self.get_queryset().filter(
+            author__in=Subscriptions.objects.filter(
+                user=request.user
+            ).values('author_id')
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get', ],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(JSONRenderer, PlainTextRenderer, CSVRenderer),
+        content_negotiation_class=FormatNegotiation,
+    )
     def download_shopping_cart(self, request):
-        shoplist = IngredientsForRecipe.objects.filter(
-            recipe__shoppers__shopper=request.user
+        shoplist = ShopListIngredient.objects.filter(
+            shopper=request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).order_by(
-            'ingredient__name'
-        ).annotate(ingredient_total=Sum('amount'))
-        return convert_to_txt(shoplist)
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            ingredient_total=F('amount'),
+        ).order_by('ingredient__name')
+        file_format = request.query_params.get('format', 'txt')
+        return shoplist_response(shoplist, file_format)
 
 
 class SubsriptionsView(ListAPIView):
 
     serializer_class = s.SubscriptionsSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = SubscriptionFilter
 
     def get_queryset(self):
         user = self.request.user
-        return user.followed_authors.all().order_by('-id')
+        return user.followed_authors.select_related('author').order_by('-id')
+
+    def paginate_queryset(self, queryset):
+        '''Рецепты всех авторов страницы подгружаем одним запросом.'''
+        page = super().paginate_queryset(queryset)
+        subscriptions = page if page is not None else list(queryset)
+        recipes = get_recent_recipes(
+            [item.author_id for item in subscriptions],
+            get_recipes_limit(self.request),
+        )
+        for item in subscriptions:
+            item.recipes_preview = recipes[item.author_id]
+        return page
 
 
 class SubscribeView(APIView):
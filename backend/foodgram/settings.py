@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +74,16 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -113,8 +124,12 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.TimedJSONRenderer',
+        'api.renderers.TimedBrowsableAPIRenderer',
+    ],
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
-    'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.ApproximateCountPagination',
     'PAGE_SIZE': 5,
     'NON_FIELD_ERRORS_KEY': 'errors'
 }
@@ -132,3 +147,16 @@ DJOSER = {
 
 }
 SHOPLIST_FILE_NAME = 'shoplist.txt'
+INGREDIENT_INDEX_MAX_SIZE = 20000
+REFERENCE_DATA_MAX_AGE = 60
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+METRICS_FLUSH_INTERVAL = 10
+METRICS_WORKER_TTL = 60 * 60
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+PAGINATION_EXACT_COUNT_LIMIT = 1000
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+RECIPE_BATCH_MAX_SIZE = 100
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 48
+FEED_CACHE_TIMEOUT = 60 * 10
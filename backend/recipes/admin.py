@@ -1,7 +1,10 @@
 from django.contrib import admin
 
+from recipes.admin_filters import (AutocompleteFilter, LargeTableAdmin,
+                                   LoadedRawIdInline)
 from recipes.models import (FavouriteRecipes, Ingredient, IngredientsForRecipe,
-                            Recipe, ShopList, Tag)
+                            Recipe, RecipeRanking, ShopList, Tag)
+from recipes.utils import get_recipe_amounts, update_recipe_in_shoplists
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -18,56 +21,112 @@ class IngredientAdmin(admin.ModelAdmin):
     информации об ингредиентах.'''
 
     list_display = ('id', 'name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name',)
     empty_value_display = '-пусто-'
 
 
-class RecipeIngredInline(admin.TabularInline):
+class RecipeIngredInline(LoadedRawIdInline):
 
     model = IngredientsForRecipe
+    raw_id_fields = ('ingredient',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipe')
 
-class RecipeAdmin(admin.ModelAdmin):
+
+class RecipeAdmin(LargeTableAdmin):
     '''Класс для вывода на странице админа
     информации о рецептах.'''
     inlines = [RecipeIngredInline, ]
-    list_display = ('id', 'name', 'author', 'pub_date')
-    list_filter = ('name', 'author', 'tags',)
+    list_display = (
+        'id',
+        'name',
+        'author',
+        'pub_date',
+        'favorites_count',
+        'shopping_cart_count',
+    )
+    list_filter = (('author', AutocompleteFilter), 'tags')
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
-    readonly_fields = ('fan_user_amount',)
+    readonly_fields = (
+        'favorites_count', 'shopping_cart_count', 'variants_version'
+    )
     filter_horizontal = ('tags',)
 
-    def fan_user_amount(self, obj):
-        return obj.followers_number()
-    fan_user_amount.short_description = 'Кол-во подписчиков'
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.variants_version = ''
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        old_amounts = get_recipe_amounts(form.instance.id) if change else {}
+        super().save_related(request, form, formsets, change)
+        update_recipe_in_shoplists(form.instance.id, old_amounts)
 
 
-class IngredientsForRecipeAdmin(admin.ModelAdmin):
+class IngredientsForRecipeAdmin(LargeTableAdmin):
     '''Класс для вывода на странице админа
-    информации по ингредиентам в рецепте.'''
+    информации по ингредиентам в рецепте. Только просмотр: состав
+    меняется на странице рецепта, где пересчитываются списки покупок
+    и поисковый индекс.'''
 
     list_display = ('id', 'recipe', 'ingredient', 'amount')
-    search_fields = ('recipe', 'ingredient')
-    list_filter = ('recipe', 'ingredient')
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    list_filter = (
+        ('recipe', AutocompleteFilter),
+        ('ingredient', AutocompleteFilter),
+    )
     empty_value_display = '-пусто-'
 
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
-class FavouriteRecipesAdmin(admin.ModelAdmin):
+class FavouriteRecipesAdmin(LargeTableAdmin):
     '''Класс для вывода на странице админа
     информации избранным рецептам.'''
 
-    list_display = ('id', 'fan_user', 'fav_recipe')
-    list_filter = ('fan_user', 'fav_recipe')
+    list_display = ('id', 'fan_user', 'fav_recipe', 'added_at')
+    list_select_related = ('fan_user', 'fav_recipe')
+    list_filter = (
+        ('fan_user', AutocompleteFilter),
+        ('fav_recipe', AutocompleteFilter),
+    )
+    autocomplete_fields = ('fan_user', 'fav_recipe')
 
 
-class ShopListAdmin(admin.ModelAdmin):
+class ShopListAdmin(LargeTableAdmin):
     '''Класс для вывода на странице админа
     информации по рецептам в списке покупок.'''
 
-    list_display = ('id', 'shopper', 'recipe_to_shop')
-    list_filter = ('shopper', 'recipe_to_shop')
+    list_display = ('id', 'shopper', 'recipe_to_shop', 'added_at')
+    list_select_related = ('shopper', 'recipe_to_shop')
+    list_filter = (
+        ('shopper', AutocompleteFilter),
+        ('recipe_to_shop', AutocompleteFilter),
+    )
+    autocomplete_fields = ('shopper', 'recipe_to_shop')
+
+
+class RecipeRankingAdmin(LargeTableAdmin):
+    '''Класс для вывода на странице админа
+    рейтинга популярных рецептов.'''
+
+    list_display = ('recipe', 'score', 'updated_at')
+    list_select_related = ('recipe',)
+    ordering = ('-score',)
+    readonly_fields = ('recipe', 'score', 'updated_at')
 
 
 admin.site.register(Tag, TagAdmin)
@@ -76,3 +135,4 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(IngredientsForRecipe, IngredientsForRecipeAdmin)
 admin.site.register(FavouriteRecipes, FavouriteRecipesAdmin)
 admin.site.register(ShopList, ShopListAdmin)
+admin.site.register(RecipeRanking, RecipeRankingAdmin)
@@ -0,0 +1,107 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import (AutocompleteSelect,
+                                          ForeignKeyRawIdWidget)
+from django.urls import NoReverseMatch, reverse
+from django.utils.text import Truncator
+
+from api.pagination import ApproximateCountPaginator
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    '''Фильтр по внешнему ключу с полем автодополнения вместо списка
+    всех связанных объектов в боковой панели: варианты подгружаются
+    по мере ввода через autocomplete админки связанной модели, поэтому
+    у нее должны быть заданы search_fields.'''
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin,
+                         field_path)
+        widget = AutocompleteSelect(field.remote_field, model_admin.admin_site)
+        widget.choices = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all()
+        ).choices
+        self.widget_id = f'autocomplete_filter_{field_path}'
+        self.rendered_widget = widget.render(
+            self.lookup_kwarg, self.lookup_val, {'id': self.widget_id}
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg]
+            ),
+            'display': 'Все',
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    '''Список объектов большой таблицы: без полного COUNT(*) на каждой
+    странице и со статикой для фильтров AutocompleteFilter.'''
+    show_full_result_count = False
+    paginator = ApproximateCountPaginator
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, None).media
+
+
+class LoadedRawIdWidget(ForeignKeyRawIdWidget):
+    '''Поле raw_id, которое подписывает выбранный объект без отдельного
+    запроса, если он уже загружен вместе со строкой inline.'''
+    loaded = None
+
+    def label_and_url_for_value(self, value):
+        obj = self.loaded
+        if obj is None or str(obj.pk) != str(value):
+            return super().label_and_url_for_value(value)
+        try:
+            url = reverse(
+                f'{self.admin_site.name}:{obj._meta.app_label}_'
+                f'{obj._meta.model_name}_change',
+                args=(obj.pk,)
+            )
+        except NoReverseMatch:
+            url = ''
+        return Truncator(obj).words(14), url
+
+
+class LoadedRawIdForm(forms.ModelForm):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            if not isinstance(field.widget, LoadedRawIdWidget):
+                continue
+            model_field = self.instance._meta.get_field(name)
+            if model_field.is_cached(self.instance):
+                field.widget.loaded = model_field.get_cached_value(
+                    self.instance
+                )
+
+
+class LoadedRawIdInline(admin.TabularInline):
+    '''Inline, в котором внешние ключи из raw_id_fields подгружаются
+    одним запросом со строками, а не отдельным запросом на каждую.'''
+    form = LoadedRawIdForm
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            *self.raw_id_fields
+        )
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.raw_id_fields:
+            kwargs['widget'] = LoadedRawIdWidget(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using')
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+import PIL
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Версия копий: меняется вместе с размерами, параметрами кодирования и
+# версией Pillow. Входит в имена файлов копий, поэтому файл по одному
+# имени никогда не перезаписывается и может кэшироваться как immutable.
+VARIANTS_VERSION = hashlib.sha256(
+    repr((VARIANT_SIZES, VARIANT_FORMATS, PIL.__version__)).encode()
+).hexdigest()[:8]
+
+
+def get_variant_name(name, variant, extension, version=VARIANTS_VERSION):
+    '''media/abc.png -> media/variants/abc_card_1a2b3c4d.webp'''
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, 'variants', f'{stem}_{variant}_{version}.{extension}'
+    )
+
+
+def get_variant_urls(recipe):
+    '''Возвращает {вариант: {формат: url}} или None, пока копии
+    изображения еще не готовы. Ссылки ведут на копии той версии, что
+    записана в рецепте: после смены параметров старые копии отдаются,
+    пока не будут созданы новые.'''
+    if not recipe.image or not recipe.variants_version:
+        return None
+    return {
+        variant: {
+            extension: default_storage.url(get_variant_name(
+                recipe.image.name, variant, extension,
+                recipe.variants_version,
+            ))
+            for extension in VARIANT_FORMATS
+        }
+        for variant in VARIANT_SIZES
+    }
+
+
+def get_variant_names(name):
+    return [
+        get_variant_name(name, variant, extension)
+        for variant in VARIANT_SIZES for extension in VARIANT_FORMATS
+    ]
+
+
+def render_variants(name):
+    '''Сохраняет уменьшенные копии изображения name текущей версии во
+    всех форматах. К базе данных не обращается, поэтому может выполняться
+    в отдельном процессе. Возвращает False, если исходный файл не удалось
+    прочитать. Имя копии определяется содержимым оригинала и версией,
+    поэтому существующие копии не пересоздаются и не перезаписываются.'''
+    missing = [
+        variant_name for variant_name in get_variant_names(name)
+        if not default_storage.exists(variant_name)
+    ]
+    if not missing:
+        return True
+    storage = Recipe._meta.get_field('image').storage
+    try:
+        with storage.open(name, 'rb') as file:
+            original = Image.open(file)
+            original.load()
+    except (FileNotFoundError, OSError):
+        logger.warning('Не удалось открыть изображение %s', name)
+        return False
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+    for variant, size in VARIANT_SIZES.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        for extension, (image_format, options) in VARIANT_FORMATS.items():
+            if image_format == 'JPEG' and image.mode == 'RGBA':
+                converted = Image.new('RGB', image.size, 'white')
+                converted.paste(image, mask=image.getchannel('A'))
+            else:
+                converted = image
+            variant_name = get_variant_name(name, variant, extension)
+            if variant_name not in missing:
+                continue
+            buffer = BytesIO()
+            converted.save(buffer, image_format, **options)
+            default_storage.save(variant_name, ContentFile(buffer.getvalue()))
+    return True
+
+
+def apply_variants(recipe_id, name):
+    '''Создает копии и записывает их версию, если за это время
+    изображение рецепта не заменили.'''
+    if render_variants(name):
+        Recipe.objects.filter(id=recipe_id, image=name).update(
+            variants_version=VARIANTS_VERSION
+        )
+
+
+def process_recipe_image(recipe_id, name):
+    try:
+        apply_variants(recipe_id, name)
+    except Exception:
+        logger.exception('Ошибка обработки изображения %s', name)
+    finally:
+        connection.close()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PIPELINE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def schedule_variants(recipe):
+    '''Ставит создание копий изображения рецепта в очередь пула потоков
+    после фиксации транзакции. При IMAGE_PIPELINE_WORKERS = 0 копии
+    создаются сразу, в потоке запроса.'''
+    recipe_id, name = recipe.id, recipe.image.name
+    if not settings.IMAGE_PIPELINE_WORKERS:
+        transaction.on_commit(lambda: apply_variants(recipe_id, name))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(process_recipe_image, recipe_id, name)
+    )
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shoplist_totals(apps, schema_editor):
+    IngredientsForRecipe = apps.get_model('recipes', 'IngredientsForRecipe')
+    ShopListIngredient = apps.get_model('recipes', 'ShopListIngredient')
+    totals = IngredientsForRecipe.objects.filter(
+        recipe__shoppers__isnull=False
+    ).values(
+        'recipe__shoppers__shopper_id', 'ingredient_id'
+    ).order_by().annotate(total=models.Sum('amount'))
+    ShopListIngredient.objects.bulk_create(
+        [
+            ShopListIngredient(
+                shopper_id=item['recipe__shoppers__shopper_id'],
+                ingredient_id=item['ingredient_id'],
+                amount=item['total'],
+            )
+            for item in totals.iterator()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_auto_20220621_1800'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopListIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shoplist_totals', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('shopper', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shoplist_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списке покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoplistingredient',
+            constraint=models.UniqueConstraint(fields=('shopper', 'ingredient'), name='unique_shopper_ingredient'),
+        ),
+        migrations.RunPython(fill_shoplist_totals, migrations.RunPython.noop),
+    ]
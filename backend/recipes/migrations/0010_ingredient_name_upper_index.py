@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'recipes_ingredient_name_upper_like'
+
+
+def create_index(apps, schema_editor):
+    '''Индекс для поиска UPPER(name) LIKE 'ПРЕФИКС%'. Создается только
+    в Postgres: SQLite не использует индексы по выражениям для LIKE,
+    там поиск остается последовательным.'''
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON recipes_ingredient (UPPER(name) text_pattern_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_auto_20261018_1738'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_name_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.BooleanField(default=False, verbose_name='Уменьшенные копии изображения готовы'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:52
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, help_text='Загрузите изображение рецепта', storage=recipes.storage.ContentAddressedStorage(), upload_to='media/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:58
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+MAX_MASK_TAG_ID = 63
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = defaultdict(int)
+    links = Recipe.tags.through.objects.filter(
+        tag_id__lte=MAX_MASK_TAG_ID
+    ).values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in links.iterator():
+        masks[recipe_id] |= 1 << (tag_id - 1)
+    recipes = [
+        Recipe(id=recipe_id, tags_mask=mask)
+        for recipe_id, mask in masks.items()
+    ]
+    Recipe.objects.bulk_update(recipes, ['tags_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Бит id - 1 для каждого тега рецепта с id не больше 63', verbose_name='Битовая маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+    ]
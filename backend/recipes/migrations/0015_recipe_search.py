@@ -0,0 +1,87 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.stemmer import stem_words
+
+INDEX_NAME = 'recipe_search_vector_gin'
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def create_search_index(apps, schema_editor):
+    '''В Postgres - GIN-индекс по search_vector и заполнение вектора,
+    в SQLite - таблица FTS5 с основами слов: встроенные токенизаторы
+    FTS5 не умеют стемминг для русского языка.'''
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+            'ON recipes_recipe USING gin (search_vector)'
+        )
+        schema_editor.execute(
+            "UPDATE recipes_recipe SET search_vector = "
+            "setweight(to_tsvector('russian', name), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(("
+            "SELECT string_agg(i.name, ' ') "
+            "FROM recipes_ingredientsforrecipe r "
+            "JOIN recipes_ingredient i ON i.id = r.ingredient_id "
+            "WHERE r.recipe_id = recipes_recipe.id), '')), 'B') || "
+            "setweight(to_tsvector('russian', text), 'C')"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            'USING fts5(name, ingredients, text)'
+        )
+        Recipe = apps.get_model('recipes', 'Recipe')
+        IngredientsForRecipe = apps.get_model(
+            'recipes', 'IngredientsForRecipe'
+        )
+        names = {}
+        links = IngredientsForRecipe.objects.values_list(
+            'recipe_id', 'ingredient__name'
+        )
+        for recipe_id, name in links.iterator():
+            names.setdefault(recipe_id, []).append(name)
+        recipes = Recipe.objects.values_list('id', 'name', 'text')
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+                'VALUES (%s, %s, %s, %s)',
+                [
+                    (
+                        recipe_id,
+                        ' '.join(stem_words(name)),
+                        ' '.join(stem_words(
+                            ' '.join(names.get(recipe_id, []))
+                        )),
+                        ' '.join(stem_words(text)),
+                    )
+                    for recipe_id, name, text in recipes.iterator()
+                ]
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название, ингредиенты и текст рецепта для полнотекстового поиска в Postgres', null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
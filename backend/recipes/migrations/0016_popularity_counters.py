@@ -0,0 +1,58 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count',
+     'recipes', 'FavouriteRecipes', 'fav_recipe'),
+    ('recipes', 'Recipe', 'shopping_cart_count',
+     'recipes', 'ShopList', 'recipe_to_shop'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'users', 'Subscriptions', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, related_app, related_model, related_field in (
+        COUNTERS
+    ):
+        rows = apps.get_model(related_app, related_model).objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+        apps.get_model(app, model).objects.update(**{field: Coalesce(
+            Subquery(rows, output_field=IntegerField()), 0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_search'),
+        ('users', '0006_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сколько пользователей добавили рецепт в избранное', verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сколько пользователей добавили рецепт в список покупок', verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-shopping_cart_count', '-pub_date', '-id'], name='recipe_shopping_cart_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
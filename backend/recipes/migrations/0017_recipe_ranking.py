@@ -0,0 +1,47 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:20
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.timezone import utc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_popularity_counters'),
+    ]
+
+    operations = [
+        # Время добавления существующих строк неизвестно, они получают
+        # дату в прошлом и в рейтинг популярных не попадают.
+        migrations.AddField(
+            model_name='favouriterecipes',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=utc), verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoplist',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=utc), verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.Recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(verbose_name='Рейтинг')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата пересчета')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинг рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-score', '-recipe'], name='recipe_ranking_score_idx'),
+        ),
+    ]
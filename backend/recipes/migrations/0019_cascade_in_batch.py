@@ -0,0 +1,35 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:30
+
+from django.conf import settings
+from django.db import migrations, models
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_author_pub_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favouriterecipes',
+            name='fan_user',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_in_batch, related_name='favourite_recipes', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик рецепта'),
+        ),
+        migrations.AlterField(
+            model_name='favouriterecipes',
+            name='fav_recipe',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_in_batch, related_name='fan_user', to='recipes.Recipe', verbose_name='Избранный рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='shoplist',
+            name='recipe_to_shop',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_in_batch, related_name='shoppers', to='recipes.Recipe', verbose_name='Рецепт в списке покупок'),
+        ),
+        migrations.AlterField(
+            model_name='shoplist',
+            name='shopper',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_in_batch, related_name='recipes_to_shop', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.19 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_cascade_in_batch'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='image_variants',
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='variants_version',
+            field=models.CharField(blank=True, default='', help_text='Пусто, пока копии не готовы', max_length=8, verbose_name='Версия уменьшенных копий изображения'),
+        ),
+    ]
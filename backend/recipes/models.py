@@ -1,7 +1,9 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
-from users.models import User
+from recipes.storage import content_addressed_storage
+from users.models import DerivedFieldsMixin, User
 
 
 class Tag(models.Model):
@@ -52,9 +54,13 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(DerivedFieldsMixin, models.Model):
     '''Класс Recipe создает БД SQL для хранения информации о рецептах.'''
 
+    DERIVED_FIELDS = (
+        'tags_mask', 'favorites_count', 'shopping_cart_count', 'search_vector'
+    )
+
     name = models.CharField(max_length=200, verbose_name='Имя рецепта')
     author = models.ForeignKey(
         User,
@@ -74,11 +80,26 @@ class Recipe(models.Model):
         verbose_name='Тег',
         help_text='Выберите теги'
     )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Битовая маска тегов',
+        help_text='Бит id - 1 для каждого тега рецепта с id не больше 63'
+    )
     image = models.ImageField(
         upload_to='media/',
+        storage=content_addressed_storage,
+        db_index=True,
         verbose_name='Изображение',
         help_text='Загрузите изображение рецепта'
     )
+    variants_version = models.CharField(
+        max_length=8,
+        blank=True,
+        default='',
+        verbose_name='Версия уменьшенных копий изображения',
+        help_text='Пусто, пока копии не готовы',
+    )
     text = models.TextField(
         verbose_name='Текст рецепта',
         help_text='Напишите здесь ваш рецепт'
@@ -92,18 +113,52 @@ class Recipe(models.Model):
         verbose_name='Дата публикаци',
         db_index=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+        help_text='Сколько пользователей добавили рецепт в избранное'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+        help_text='Сколько пользователей добавили рецепт в список покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+        help_text='Название, ингредиенты и текст рецепта для полнотекстового '
+                  'поиска в Postgres'
+    )
 
     class Meta:
-        ordering = ['-pub_date', ]
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['-shopping_cart_count', '-pub_date', '-id'],
+                name='recipe_shopping_cart_count_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
         return self.name
 
-    def followers_number(self):
-        return self.fan_user.count()
-
 
 class IngredientsForRecipe(models.Model):
     '''Класс создает БД SQL для хранения информации
@@ -137,22 +192,37 @@ class IngredientsForRecipe(models.Model):
         return f'{self.recipe.name} - {self.ingredient.name}'
 
 
+def cascade_in_batch(collector, field, sub_objs, using):
+    '''CASCADE, который сообщает каждой удаляемой строке весь список
+    удаляемых вместе с ней (атрибут delete_batch): обработчик pre_delete
+    может обработать их за один проход, а не по строке.'''
+    batch = list(sub_objs)
+    for obj in batch:
+        obj.delete_batch = batch
+    models.CASCADE(collector, field, sub_objs, using)
+
+
 class FavouriteRecipes(models.Model):
     '''Класс FavouriteRecipes создает БД SQL для хранения
     информации о рецептах, добавленных в избранное.'''
 
     fan_user = models.ForeignKey(
         User,
-        on_delete=models.CASCADE,
+        on_delete=cascade_in_batch,
         related_name='favourite_recipes',
         verbose_name='Подписчик рецепта'
     )
     fav_recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade_in_batch,
         related_name='fan_user',
         verbose_name='Избранный рецепт'
     )
+    added_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         constraints = [
@@ -171,16 +241,21 @@ class ShopList(models.Model):
 
     shopper = models.ForeignKey(
         User,
-        on_delete=models.CASCADE,
+        on_delete=cascade_in_batch,
         related_name='recipes_to_shop',
         verbose_name='Покупатель'
     )
     recipe_to_shop = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade_in_batch,
         related_name='shoppers',
         verbose_name='Рецепт в списке покупок'
     )
+    added_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         constraints = [
@@ -191,3 +266,67 @@ class ShopList(models.Model):
         ]
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+
+
+class ShopListIngredient(models.Model):
+    '''Класс ShopListIngredient создает БД SQL для хранения суммарного
+    количества каждого ингредиента в списке покупок пользователя.
+    Таблица обновляется при изменении списка покупок и состава рецептов,
+    поэтому выгрузка списка покупок - это одно чтение по индексу.'''
+
+    shopper = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shoplist_ingredients',
+        verbose_name='Покупатель'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shoplist_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shopper', 'ingredient'],
+                name='unique_shopper_ingredient'
+            )
+        ]
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+
+
+class RecipeRanking(models.Model):
+    '''Класс RecipeRanking создает БД SQL для хранения рейтинга
+    популярных рецептов: затухающей со временем суммы добавлений
+    в избранное и в списки покупок. Таблица пересчитывается командой
+    refresh_trending и содержит только рецепты с недавней активностью.'''
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(verbose_name='Рейтинг')
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата пересчета'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-score', '-recipe'],
+                name='recipe_ranking_score_idx'
+            ),
+        ]
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинг рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.score:.3f}'
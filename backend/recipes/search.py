@@ -0,0 +1,126 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, OuterRef, Q, Subquery, TextField
+from django.db.models.expressions import RawSQL
+
+from recipes.models import IngredientsForRecipe, Recipe
+from recipes.stemmer import stem_words
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса полей для bm25 в SQLite, как A, B и C в Postgres.
+FTS_WEIGHTS = '10.0, 4.0, 1.0'
+
+
+def update_search_index(recipe_ids=None):
+    '''Пересчитывает поисковый индекс рецептов recipe_ids (всех, если
+    не указаны): название, ингредиенты и текст. В Postgres это
+    Recipe.search_vector с GIN-индексом, в SQLite - таблица FTS5,
+    в которую пишутся основы слов.'''
+    if connection.vendor == 'postgresql':
+        update_search_vectors(recipe_ids)
+    elif connection.vendor == 'sqlite':
+        update_fts_table(recipe_ids)
+
+
+def schedule_search_index(recipe_ids):
+    '''Откладывает переиндексацию до фиксации транзакции: рецепт
+    сохраняется раньше своих ингредиентов, и к этому моменту они уже
+    записаны.'''
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+def update_search_vectors(recipe_ids):
+    ingredient_names = IngredientsForRecipe.objects.filter(
+        recipe_id=OuterRef('pk')
+    ).order_by().values('recipe_id').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names, output_field=TextField()),
+            weight='B',
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def update_fts_table(recipe_ids):
+    recipes = Recipe.objects.values_list('id', 'name', 'text')
+    ingredients = IngredientsForRecipe.objects.values_list(
+        'recipe_id', 'ingredient__name'
+    )
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        recipes = recipes.filter(id__in=recipe_ids)
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+    names = {}
+    for recipe_id, name in ingredients.iterator():
+        names.setdefault(recipe_id, []).append(name)
+    rows = [
+        (
+            recipe_id,
+            ' '.join(stem_words(name)),
+            ' '.join(stem_words(' '.join(names.get(recipe_id, [])))),
+            ' '.join(stem_words(text)),
+        )
+        for recipe_id, name, text in recipes.iterator()
+    ]
+    with connection.cursor() as cursor:
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        else:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(recipe_id,) for recipe_id in recipe_ids]
+            )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+            'VALUES (%s, %s, %s, %s)',
+            rows
+        )
+
+
+def search_recipes(queryset, value):
+    '''Отбирает рецепты по запросу value и сортирует их по релевантности.
+    Условие совместимо с остальными фильтрами: в Postgres это поиск
+    по GIN-индексу, в SQLite - подзапрос к FTS5.'''
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    if connection.vendor == 'sqlite':
+        words = stem_words(value)
+        if not words:
+            return queryset
+        match = ' '.join(f'"{word}"' for word in words)
+        # id__in=RawSQL(...) дает IN ((SELECT ...)), что SQLite читает
+        # как скалярный подзапрос и оставляет только первую строку.
+        # Поэтому условие целиком - аннотация, сравниваемая с True;
+        # подзапрос не коррелирован, MATCH выполняется один раз.
+        return queryset.annotate(search_match=RawSQL(
+            f'{Recipe._meta.db_table}.id IN (SELECT rowid FROM '
+            f'{FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+            (match,),
+            output_field=BooleanField(),
+        )).filter(search_match=True).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = {Recipe._meta.db_table}.id',
+            (match,)
+        )).order_by('-search_rank', '-pub_date', '-id')
+    return queryset.filter(
+        Q(name__icontains=value)
+        | Q(text__icontains=value)
+        | Q(ingredients__name__icontains=value)
+    ).distinct()
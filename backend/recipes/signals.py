@@ -0,0 +1,231 @@
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.images import schedule_variants
+from recipes.models import (FavouriteRecipes, Ingredient, IngredientsForRecipe,
+                            Recipe, ShopList, Tag)
+from recipes.search import schedule_search_index
+from recipes.utils import (MAX_MASK_TAG_ID, apply_shoplist_delta,
+                           bump_recipe_versions, bump_table_version,
+                           bump_versions, change_counter, decrement_counters,
+                           get_recipe_amounts, get_tags_mask,
+                           remove_from_shoplist_totals,
+                           reset_followed_author_ids, update_tags_masks)
+from users.models import Subscriptions, User
+
+USER_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=ShopList)
+def add_recipe_to_shoplist_totals(sender, instance, created, **kwargs):
+    if created:
+        apply_shoplist_delta(
+            [instance.shopper_id],
+            get_recipe_amounts(instance.recipe_to_shop_id)
+        )
+
+
+def claim_delete_batch(instance, flag):
+    '''Строки, удаляемые каскадом вместе с instance (см. cascade_in_batch),
+    или только сам instance. Возвращает их при первом вызове с данным
+    flag, при следующих - пустой список: вся пачка обрабатывается
+    за один проход.'''
+    if getattr(instance, flag, False):
+        return []
+    batch = getattr(instance, 'delete_batch', [instance])
+    for row in batch:
+        setattr(row, flag, True)
+    return batch
+
+
+@receiver(pre_delete, sender=ShopList)
+def remove_recipe_from_shoplist_totals(sender, instance, **kwargs):
+    batch = claim_delete_batch(instance, 'totals_removed')
+    if batch:
+        remove_from_shoplist_totals(batch)
+
+
+@receiver(post_save, sender=FavouriteRecipes)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, [instance.fav_recipe_id], 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=FavouriteRecipes)
+def decrement_favorites_count(sender, instance, **kwargs):
+    batch = claim_delete_batch(instance, 'counted')
+    decrement_counters(
+        Recipe, [row.fav_recipe_id for row in batch], 'favorites_count'
+    )
+
+
+@receiver(post_save, sender=ShopList)
+def increment_shopping_cart_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe, [instance.recipe_to_shop_id], 'shopping_cart_count', 1
+        )
+
+
+@receiver(post_delete, sender=ShopList)
+def decrement_shopping_cart_count(sender, instance, **kwargs):
+    batch = claim_delete_batch(instance, 'counted')
+    decrement_counters(
+        Recipe, [row.recipe_to_shop_id for row in batch], 'shopping_cart_count'
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, [instance.author_id], 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User, [instance.author_id], 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscriptions)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, [instance.author_id], 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscriptions)
+def decrement_followers_count(sender, instance, **kwargs):
+    change_counter(User, [instance.author_id], 'followers_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def bump_author_feed_version(sender, instance, created, **kwargs):
+    '''Новый рецепт сбрасывает закэшированные ленты подписчиков автора.'''
+    if created:
+        bump_versions('author_version', [instance.author_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def bump_author_feed_version_on_delete(sender, instance, **kwargs):
+    bump_versions('author_version', [instance.author_id])
+
+
+@receiver(post_save, sender=Subscriptions)
+@receiver(post_delete, sender=Subscriptions)
+def reset_user_feed(sender, instance, **kwargs):
+    reset_followed_author_ids(instance.user_id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_table_version(Ingredient)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_table_version(Tag)
+
+
+@receiver(post_delete, sender=Tag)
+def remove_tag_from_masks(sender, instance, **kwargs):
+    '''Связи удаляются каскадом без m2m_changed, поэтому бит тега
+    снимается со всех рецептов отдельно.'''
+    bit = get_tags_mask([instance.id])
+    if bit:
+        Recipe.objects.annotate(
+            tag_bit=F('tags_mask').bitand(bit)
+        ).filter(tag_bit__gt=0).update(tags_mask=F('tags_mask') - bit)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    bump_recipe_versions([instance.id])
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(sender, instance, **kwargs):
+    if instance.image and not instance.variants_version:
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_recipe_search_index(sender, instance, **kwargs):
+    '''Ингредиенты из API и админки пишутся в одной транзакции с
+    сохранением рецепта, поэтому отдельной переиндексации на каждую
+    строку IngredientsForRecipe не нужно.'''
+    schedule_search_index([instance.id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_index(sender, instance, created,
+                                           **kwargs):
+    if not created:
+        schedule_search_index(
+            instance.recipes.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=IngredientsForRecipe)
+@receiver(post_delete, sender=IngredientsForRecipe)
+def bump_recipe_version_on_ingredients(sender, instance, **kwargs):
+    bump_recipe_versions([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_version_on_tags(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_recipe_versions([instance.id])
+    elif pk_set:
+        bump_recipe_versions(pk_set)
+    else:
+        bump_recipe_versions(
+            list(instance.recipes.values_list('id', flat=True))
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_recipe_tags_mask(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    '''Теги одного рецепта меняют маску одним UPDATE без чтения:
+    добавленные биты включаются, удаленные выключаются.'''
+    if reverse and action == 'pre_clear':
+        instance.cleared_recipe_ids = list(
+            instance.recipes.values_list('id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        update_tags_masks(
+            instance.cleared_recipe_ids if action == 'post_clear' else pk_set
+        )
+        return
+    recipe = Recipe.objects.filter(id=instance.id)
+    if action == 'post_clear':
+        recipe.update(tags_mask=0)
+        return
+    bits = get_tags_mask(
+        tag_id for tag_id in pk_set if tag_id <= MAX_MASK_TAG_ID
+    )
+    if not bits:
+        return
+    if action == 'post_add':
+        recipe.update(tags_mask=F('tags_mask').bitor(bits))
+    else:
+        recipe.update(tags_mask=F('tags_mask').bitand(~bits))
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, update_fields, **kwargs):
+    if update_fields and not USER_PUBLIC_FIELDS & set(update_fields):
+        return
+    bump_recipe_versions(
+        list(instance.recipes.values_list('id', flat=True))
+    )
@@ -0,0 +1,51 @@
+import hashlib
+import os
+import posixpath
+from uuid import uuid4
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''Файловое хранилище, в котором имя файла - хэш его содержимого:
+    media/ab/abcdef...png. Повторная загрузка того же изображения
+    не создает новый файл, а возвращает имя уже сохраненного.
+    Неиспользуемые файлы удаляет команда collect_media_garbage.'''
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], f'{digest}{extension}'
+        )
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name or content.name, content)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            # Время изменения показывает сборщику мусора, что файл
+            # только что снова понадобился.
+            os.utime(self.path(name))
+            return name
+        # Одинаковый файл может сохраняться параллельно, поэтому он
+        # пишется во временный и атомарно переименовывается.
+        temp_name = super()._save(f'{name}.{uuid4().hex}.tmp', content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
+
+
+content_addressed_storage = ContentAddressedStorage()
@@ -0,0 +1,76 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import FavouriteRecipes, RecipeRanking, ShopList
+
+# Вклад одного добавления в рейтинг: (модель, поле рецепта, вес).
+TRENDING_EVENTS = (
+    (FavouriteRecipes, 'fav_recipe_id', 2.0),
+    (ShopList, 'recipe_to_shop_id', 1.0),
+)
+
+
+def get_trending_scores(now=None):
+    '''Затухающие рейтинги рецептов: каждое добавление в избранное или
+    в список покупок за последние TRENDING_WINDOW_DAYS дней дает свой
+    вес, который уменьшается вдвое каждые TRENDING_HALF_LIFE_HOURS
+    часов. Читаются только строки окна по индексу added_at, сгруппированные
+    по часам.'''
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = settings.TRENDING_HALF_LIFE_HOURS
+    scores = defaultdict(float)
+    for model, recipe_field, weight in TRENDING_EVENTS:
+        rows = model.objects.filter(added_at__gte=since).annotate(
+            hour=TruncHour('added_at')
+        ).values_list(recipe_field, 'hour').annotate(
+            total=Count('pk')
+        ).order_by()
+        for recipe_id, hour, total in rows.iterator():
+            # Возраст считается от середины часа.
+            age = (now - hour).total_seconds() / 3600 - 0.5
+            scores[recipe_id] += weight * total * 0.5 ** (
+                max(age, 0) / half_life
+            )
+    return scores
+
+
+@transaction.atomic
+def refresh_trending(now=None):
+    '''Пересчитывает RecipeRanking: рецепты без активности в окне
+    удаляются из таблицы, новые добавляются, остальным обновляется
+    рейтинг. Возвращает количество добавленных, обновленных и удаленных
+    строк.'''
+    now = now or timezone.now()
+    scores = get_trending_scores(now)
+    current = dict(RecipeRanking.objects.values_list('recipe_id', 'score'))
+    removed = [
+        recipe_id for recipe_id in current if recipe_id not in scores
+    ]
+    for start in range(0, len(removed), 500):
+        RecipeRanking.objects.filter(
+            recipe_id__in=removed[start:start + 500]
+        ).delete()
+    changed = [
+        RecipeRanking(recipe_id=recipe_id, score=score, updated_at=now)
+        for recipe_id, score in scores.items()
+        if recipe_id in current and current[recipe_id] != score
+    ]
+    RecipeRanking.objects.bulk_update(
+        changed, ['score', 'updated_at'], batch_size=500
+    )
+    added = [
+        RecipeRanking(recipe_id=recipe_id, score=score, updated_at=now)
+        for recipe_id, score in scores.items()
+        if recipe_id not in current
+    ]
+    RecipeRanking.objects.bulk_create(
+        added, batch_size=500, ignore_conflicts=True
+    )
+    return len(added), len(changed), len(removed)
@@ -0,0 +1,386 @@
+from collections import Counter, defaultdict
+from hashlib import md5
+from uuid import uuid4
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from recipes.models import (FavouriteRecipes, IngredientsForRecipe, Recipe,
+                            ShopList, ShopListIngredient)
+from users.models import Subscriptions, User
+
+# Теги с большими id в маску не попадают, фильтр по ним идет через
+# таблицу связей.
+MAX_MASK_TAG_ID = 63
+# Счетчик: (модель со счетчиком, модель строк, поле связи строк с ней).
+COUNTERS = {
+    'favorites_count': (Recipe, FavouriteRecipes, 'fav_recipe'),
+    'shopping_cart_count': (Recipe, ShopList, 'recipe_to_shop'),
+    'recipes_count': (User, Recipe, 'author'),
+    'followers_count': (User, Subscriptions, 'author'),
+}
+REPAIR_BATCH_SIZE = 500
+# Строк в одном INSERT: SQLite ограничивает число параметров запроса.
+UPSERT_BATCH_SIZE = 300
+
+
+def get_table_version(model):
+    '''Возвращает текущую версию содержимого таблицы модели.
+    Версия хранится в кэше Django и меняется при каждой записи,
+    поэтому с общим кэшем ее видят все процессы.'''
+    key = f'table_version:{model._meta.label_lower}'
+    cache.add(key, uuid4().hex, timeout=None)
+    return cache.get(key)
+
+
+def bump_table_version(model):
+    '''Сбрасывает версию таблицы после фиксации транзакции, как
+    и bump_versions.'''
+    key = f'table_version:{model._meta.label_lower}'
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def is_cache_shared():
+    '''Кэш в памяти процесса не виден другим процессам: версии,
+    сброшенные в management-команде, не дойдут до веб-сервера.'''
+    return not isinstance(
+        caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache)
+    )
+
+
+def get_versions(prefix, ids):
+    '''Возвращает {id: версия} для объектов ids из кэша, недостающие
+    версии создаются.'''
+    keys = {pk: f'{prefix}:{pk}' for pk in ids}
+    versions = cache.get_many(keys.values())
+    missing = {key: uuid4().hex for key in keys.values()
+               if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {pk: versions[key] for pk, key in keys.items()}
+
+
+def bump_versions(prefix, ids):
+    '''Сбрасывает версии после фиксации транзакции, чтобы параллельный
+    запрос не закэшировал данные до коммита.'''
+    keys = [f'{prefix}:{pk}' for pk in ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_recipe_versions(recipe_ids):
+    '''Возвращает {id рецепта: версия}. Версия рецепта меняется
+    при изменении самого рецепта, его ингредиентов, тегов и автора.'''
+    return get_versions('recipe_version', recipe_ids)
+
+
+def bump_recipe_versions(recipe_ids):
+    bump_versions('recipe_version', recipe_ids)
+
+
+def get_followed_author_ids(user_id):
+    '''id авторов из подписок пользователя. Хранятся в кэше до
+    изменения подписок.'''
+    key = f'followed_authors:{user_id}'
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = set(
+            Subscriptions.objects.filter(
+                user_id=user_id
+            ).values_list('author_id', flat=True)
+        )
+        cache.set(key, author_ids, timeout=None)
+    return author_ids
+
+
+def reset_followed_author_ids(user_id):
+    key = f'followed_authors:{user_id}'
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_feed_cache_key(user_id, page_size):
+    '''Ключ первой страницы ленты: в него входят версии всех авторов
+    из подписок. Публикация рецепта меняет версию одного автора, без
+    обхода его подписчиков.'''
+    versions = get_versions(
+        'author_version', sorted(get_followed_author_ids(user_id))
+    )
+    digest = md5(
+        ','.join(f'{pk}:{version}' for pk, version in versions.items())
+        .encode()
+    ).hexdigest()
+    return f'feed:{user_id}:{page_size}:{digest}'
+
+
+def get_tags_mask(tag_ids):
+    '''Битовая маска тегов, None если какой-то тег в маску не помещается.'''
+    mask = 0
+    for tag_id in tag_ids:
+        if not 1 <= tag_id <= MAX_MASK_TAG_ID:
+            return None
+        mask |= 1 << (tag_id - 1)
+    return mask
+
+
+def update_tags_masks(recipe_ids=None):
+    '''Пересчитывает Recipe.tags_mask по таблице связей для рецептов
+    recipe_ids (для всех, если не указаны).'''
+    links = Recipe.tags.through.objects.filter(
+        tag_id__lte=MAX_MASK_TAG_ID
+    ).values_list('recipe_id', 'tag_id')
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        links = links.filter(recipe_id__in=recipe_ids)
+    masks = defaultdict(int)
+    for recipe_id, tag_id in links.iterator():
+        masks[recipe_id] |= 1 << (tag_id - 1)
+    if recipe_ids is not None:
+        # Маски нескольких рецептов записываются без предварительного
+        # чтения: это один UPDATE вместо двух запросов.
+        changed = [
+            Recipe(id=recipe_id, tags_mask=masks[recipe_id])
+            for recipe_id in recipe_ids
+        ]
+    else:
+        changed = []
+        for recipe in Recipe.objects.only('id', 'tags_mask').iterator():
+            if recipe.tags_mask != masks[recipe.id]:
+                recipe.tags_mask = masks[recipe.id]
+                changed.append(recipe)
+    Recipe.objects.bulk_update(changed, ['tags_mask'], batch_size=500)
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(
+        IngredientsForRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    )
+
+
+def apply_shoplist_delta(shopper_ids, deltas):
+    '''Прибавляет к суммарному количеству ингредиентов в списках
+    покупок пользователей shopper_ids значения из deltas
+    ({id ингредиента: изменение}).'''
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+    apply_shoplist_deltas({
+        (shopper_id, ingredient_id): delta
+        for shopper_id in shopper_ids
+        for ingredient_id, delta in deltas.items()
+    })
+
+
+@transaction.atomic
+def apply_shoplist_deltas(deltas):
+    '''Применяет изменения {(id покупателя, id ингредиента): изменение}
+    к ShopListIngredient. Строки пишутся через INSERT ... ON CONFLICT
+    DO UPDATE (Postgres и SQLite 3.24+): параллельные добавления одного
+    ингредиента складываются в базе, а не падают на уникальности.
+    Обнулившиеся строки удаляются.'''
+    rows = sorted(key + (delta,) for key, delta in deltas.items() if delta)
+    if not rows:
+        return
+    meta = ShopListIngredient._meta
+    table = connection.ops.quote_name(meta.db_table)
+    shopper, ingredient, amount = (
+        connection.ops.quote_name(meta.get_field(name).column)
+        for name in ('shopper', 'ingredient', 'amount')
+    )
+    with connection.cursor() as cursor:
+        # Строки отсортированы, поэтому блокировки берутся в одном порядке.
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({shopper}, {ingredient}, {amount}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({shopper}, {ingredient}) DO UPDATE '
+                f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                [value for row in batch for value in row]
+            )
+    ShopListIngredient.objects.filter(
+        shopper_id__in={row[0] for row in rows},
+        ingredient_id__in={row[1] for row in rows},
+        amount__lte=0,
+    ).delete()
+
+
+def remove_from_shoplist_totals(shoplist_rows):
+    '''Вычитает рецепты удаляемых строк ShopList из списков покупок
+    их владельцев: состав всех рецептов читается одним запросом,
+    изменения применяются одним проходом.'''
+    recipe_ingredients = IngredientsForRecipe.objects.filter(
+        recipe_id__in={row.recipe_to_shop_id for row in shoplist_rows}
+    ).values_list('recipe_id', 'ingredient_id', 'amount')
+    amounts = defaultdict(dict)
+    for recipe_id, ingredient_id, amount in recipe_ingredients.iterator():
+        amounts[recipe_id][ingredient_id] = amount
+    deltas = defaultdict(int)
+    for row in shoplist_rows:
+        for ingredient_id, amount in amounts[row.recipe_to_shop_id].items():
+            deltas[(row.shopper_id, ingredient_id)] -= amount
+    apply_shoplist_deltas(deltas)
+
+
+def get_recipes_amounts(recipe_ids):
+    '''Суммарные количества ингредиентов нескольких рецептов:
+    {id ингредиента: сумма}.'''
+    return dict(
+        IngredientsForRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').order_by().annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total')
+    )
+
+
+def update_recipe_in_shoplists(recipe_id, old_amounts, new_amounts=None):
+    '''Переносит изменение состава рецепта в списки покупок всех
+    пользователей, у которых этот рецепт в корзине. Если новый состав
+    не передан, он читается из базы.'''
+    if new_amounts is None:
+        new_amounts = get_recipe_amounts(recipe_id)
+    deltas = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in set(old_amounts) | set(new_amounts)
+    }
+    shopper_ids = ShopList.objects.filter(
+        recipe_to_shop_id=recipe_id
+    ).values_list('shopper_id', flat=True)
+    apply_shoplist_delta(shopper_ids, deltas)
+
+
+def get_expected_shoplist_totals():
+    '''Пересчитывает суммы по ингредиентам в списках покупок
+    напрямую из рецептов: {(id покупателя, id ингредиента): сумма}.'''
+    totals = IngredientsForRecipe.objects.filter(
+        recipe__shoppers__isnull=False
+    ).values(
+        'recipe__shoppers__shopper_id', 'ingredient_id'
+    ).order_by().annotate(total=Sum('amount'))
+    return {
+        (item['recipe__shoppers__shopper_id'], item['ingredient_id']):
+            item['total']
+        for item in totals.iterator()
+    }
+
+
+def change_counter(model, ids, field, delta):
+    '''Атомарно меняет счетчик field на delta у объектов ids одним
+    UPDATE с F(), без чтения текущего значения. Счетчик не уходит ниже
+    нуля, расхождения исправляет команда repair_counters.'''
+    rows = model.objects.filter(id__in=ids)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def decrement_counters(model, ids, field):
+    '''Уменьшает счетчик field на число повторов каждого id в ids:
+    один UPDATE на каждое различное значение уменьшения.'''
+    by_delta = defaultdict(list)
+    for pk, times in Counter(ids).items():
+        by_delta[times].append(pk)
+    for times, pks in by_delta.items():
+        change_counter(model, pks, field, -times)
+
+
+def get_list_columns(model, user_field, recipe_field):
+    meta = model._meta
+    return (connection.ops.quote_name(meta.db_table),) + tuple(
+        connection.ops.quote_name(meta.get_field(name).column)
+        for name in (user_field, recipe_field, 'added_at')
+    )
+
+
+def add_to_list(model, user_field, recipe_field, user_id, recipe_ids):
+    '''Добавляет рецепты recipe_ids в список пользователя (избранное или
+    покупки) одним INSERT ... ON CONFLICT DO NOTHING RETURNING (Postgres
+    и SQLite 3.35+). Возвращает id рецептов, строки которых вставил
+    именно этот запрос: из параллельных добавлений одного рецепта его
+    получит только одно. Сигналы не отправляются.'''
+    if not recipe_ids:
+        return set()
+    table, user, recipe, added_at = get_list_columns(
+        model, user_field, recipe_field
+    )
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user}, {recipe}, {added_at}) '
+            f'VALUES {", ".join(["(%s, %s, %s)"] * len(recipe_ids))} '
+            f'ON CONFLICT ({user}, {recipe}) DO NOTHING RETURNING {recipe}',
+            [
+                value for recipe_id in sorted(recipe_ids)
+                for value in (user_id, recipe_id, now)
+            ]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def remove_from_list(model, user_field, recipe_field, user_id, recipe_ids):
+    '''Удаляет рецепты recipe_ids из списка пользователя одним
+    DELETE ... RETURNING и возвращает id рецептов, строки которых удалил
+    именно этот запрос. Сигналы не отправляются.'''
+    if not recipe_ids:
+        return set()
+    table, user, recipe, _ = get_list_columns(
+        model, user_field, recipe_field
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {user} = %s AND {recipe} IN '
+            f'({", ".join(["%s"] * len(recipe_ids))}) RETURNING {recipe}',
+            [user_id, *recipe_ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def get_actual_count(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def repair_counters(fields=None, ids=None, dry_run=False):
+    '''Сверяет счетчики fields (все, если не указаны) с количеством
+    строк в связанных таблицах и исправляет расхождения. Возвращает
+    {счетчик: число исправленных объектов}.'''
+    repaired = {}
+    for field in fields or COUNTERS:
+        model, related_model, related_field = COUNTERS[field]
+        actual = get_actual_count(related_model, related_field)
+        queryset = model.objects.all()
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        wrong = list(
+            queryset.annotate(actual_count=actual).exclude(
+                **{field: F('actual_count')}
+            ).values_list('id', flat=True)
+        )
+        repaired[field] = len(wrong)
+        if dry_run:
+            continue
+        for start in range(0, len(wrong), REPAIR_BATCH_SIZE):
+            model.objects.filter(
+                id__in=wrong[start:start + REPAIR_BATCH_SIZE]
+            ).update(**{field: actual})
+    return repaired
@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import Group, UserAdmin
 
+from recipes.admin_filters import AutocompleteFilter, LargeTableAdmin
 from users.models import Subscriptions, User
 
 
-class MyUserAdmin(UserAdmin):
+class MyUserAdmin(LargeTableAdmin, UserAdmin):
     '''Класс для вывода на странице админа
     информации о пользователе.'''
 
@@ -14,17 +15,25 @@ class MyUserAdmin(UserAdmin):
         'email',
         'first_name',
         'last_name',
-        'is_staff'
+        'is_staff',
+        'recipes_count',
+        'followers_count',
     )
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    readonly_fields = ('recipes_count', 'followers_count')
 
 
-class SubscriptionsAdmin(admin.ModelAdmin):
+class SubscriptionsAdmin(LargeTableAdmin):
     '''Класс для вывода на странице админа
     информации о подписчиках на автора.'''
 
     list_display = ('id', 'user', 'author')
-    list_filter = ('user', 'author')
+    list_select_related = ('user', 'author')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('author', AutocompleteFilter),
+    )
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(User, MyUserAdmin)
@@ -3,16 +3,46 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 
-class User(AbstractUser):
+class DerivedFieldsMixin:
+    '''Поля DERIVED_FIELDS (счетчики, маски, поисковые векторы) меняются
+    только запросами UPDATE, поэтому save() существующего объекта их
+    не записывает: иначе значения, прочитанные до такого запроса,
+    затерли бы его результат.'''
+
+    DERIVED_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(DerivedFieldsMixin, AbstractUser):
     '''Класс User создает БД SQL для хранения
     информации о пользователях.'''
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    DERIVED_FIELDS = ('recipes_count', 'followers_count')
 
     email = models.EmailField(_('email address'), blank=False, unique=True)
     first_name = models.CharField(_('first name'), max_length=30, blank=False)
     last_name = models.CharField(_('last name'), max_length=150, blank=False)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
 
     class Meta:
         ordering = ['-id']